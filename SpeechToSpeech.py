@@ -1,44 +1,180 @@
-from flask import Flask, render_template_string, request, Response
-from flask_socketio import SocketIO, emit
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+import socketio
+import uvicorn
 import soundfile as sf
+import av
 import torch
 from transformers import Wav2Vec2ForCTC, Wav2Vec2Processor, VitsModel, AutoTokenizer
-from indic_transliteration import sanscript
-from indic_transliteration.sanscript import transliterate
 from deep_translator import GoogleTranslator
+import asyncio
 import io
+import itertools
+import os
+import re
+import unicodedata
 import numpy as np
-import eventlet
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from functools import lru_cache
+from collections import OrderedDict
 
 # --- Backend Application ---
 
-app = Flask(__name__)
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
+# Socket.IO runs on asyncio alongside FastAPI. Model inference, translation and the
+# backend HTTP call run in worker threads (asyncio.to_thread), so a long forward pass
+# never stalls the event loop that serves every other session.
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins="*")
+fastapi_app = FastAPI(title="Gujarati Speech App")
+app = socketio.ASGIApp(sio, fastapi_app)
 
 # --- Load the STT and TTS models ---
 
+# Leave half the cores for the web server, translators and the other model
+torch.set_num_threads(max(1, (os.cpu_count() or 2) // 2))
+torch.set_num_interop_threads(2)
+
+# Run the PyTorch models on the GPU when one is present
+DEVICE = 'cuda' if torch.cuda.is_available() else 'cpu'
+
+def _cpu_supports_bf16() -> bool:
+    """Returns True on CPUs with native BF16 support (AVX512-BF16 / AMX)."""
+    try:
+        return torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except Exception:
+        return False
+
+# BF16 autocast halves the weight/activation bandwidth of the linear layers, but is
+# only a win where the CPU runs BF16 natively; elsewhere it is emulated and slower.
+USE_BF16 = torch.cuda.is_bf16_supported() if DEVICE == 'cuda' else _cpu_supports_bf16()
+# torch.compile fuses pointwise ops; set TORCH_COMPILE=0 if no C++ toolchain is available
+USE_TORCH_COMPILE = os.getenv("TORCH_COMPILE", "1") != "0"
+
+# Optional: Intel Extension for PyTorch swaps Conv/Linear for oneDNN kernels on Intel CPUs
+try:
+    import intel_extension_for_pytorch as ipex
+except ImportError:
+    ipex = None
+
+def optimize_torch_model(model):
+    """
+    Puts a model in eval mode on DEVICE, applies IPEX kernel optimizations when
+    available and, if enabled, wraps it with torch.compile.
+    """
+    model.to(DEVICE).eval()
+    if DEVICE == 'cuda':
+        if USE_TORCH_COMPILE:
+            # max-autotune picks the fastest kernels and replays each input shape as a
+            # CUDA graph, removing the per-op launch overhead that dominates small batches.
+            # STT inputs are bucketed (see _transcribe_batch) to bound the graph count.
+            model = torch.compile(model, mode='max-autotune', backend='inductor')
+        return model
+    if ipex is not None:
+        model = ipex.optimize(model, dtype=torch.bfloat16 if USE_BF16 else torch.float32, inplace=True)
+    # Share the weights actually used for inference (IPEX may replace them with
+    # prepacked copies), so pre-forked workers map the parent's pages
+    model.share_memory()
+    if USE_TORCH_COMPILE:
+        # Audio and text lengths vary per request, so compile for dynamic shapes
+        model = torch.compile(
+            model,
+            mode='reduce-overhead',
+            dynamic=True,
+            backend='ipex' if ipex is not None else 'inductor'
+        )
+    return model
+
+# On CPU, model weights are moved to shared memory once optimized. Under a pre-forking
+# server (see gunicorn.conf.py) every worker then maps the parent's physical pages
+# instead of touching them into private copy-on-write copies. On GPU the models are
+# loaded by each worker after the fork, since a CUDA context cannot cross a fork.
+torch.multiprocessing.set_sharing_strategy('file_system')
+
+def inference_context():
+    """Autocast context for model forwards (BF16 only where natively supported)."""
+    return torch.autocast(DEVICE, dtype=torch.bfloat16, enabled=USE_BF16)
+
 # STT: Gujarati Speech to Gujarati Text
 try:
     stt_processor = Wav2Vec2Processor.from_pretrained("addy88/wav2vec2-gujarati-stt")
-    stt_model = Wav2Vec2ForCTC.from_pretrained("addy88/wav2vec2-gujarati-stt")
+    stt_model = optimize_torch_model(Wav2Vec2ForCTC.from_pretrained("addy88/wav2vec2-gujarati-stt"))
     print("STT Model and processor loaded successfully.")
 except Exception as e:
     print(f"Error loading STT model: {e}")
     stt_processor = None
     stt_model = None
 
+# Optional: INT8 OpenVINO build of the STT model (see scripts/quantize_stt.py).
+# When present it replaces the PyTorch forward pass in transcribe_audio.
+STT_OV_MODEL_PATH = "models/stt_int8.xml"
+stt_ov_model = None
+if DEVICE == 'cpu' and os.path.exists(STT_OV_MODEL_PATH):
+    try:
+        import openvino as ov
+        stt_ov_model = ov.Core().compile_model(
+            STT_OV_MODEL_PATH, 'CPU', config={'INFERENCE_NUM_THREADS': os.cpu_count()}
+        )
+        print("INT8 OpenVINO STT model loaded successfully.")
+    except Exception as e:
+        print(f"Error loading OpenVINO STT model, falling back to PyTorch: {e}")
+        stt_ov_model = None
+
+# Optional: INT8 CTranslate2 build of the STT model, created with
+# `ct2-transformers-converter --model addy88/wav2vec2-gujarati-stt --output_dir models/ct2-guj-stt --quantization int8`.
+# The HF processor is still used for feature extraction and decoding.
+STT_CT2_MODEL_PATH = "models/ct2-guj-stt"
+stt_ct2_model = None
+if DEVICE == 'cpu' and stt_ov_model is None and os.path.exists(STT_CT2_MODEL_PATH):
+    try:
+        import ctranslate2
+        stt_ct2_model = ctranslate2.models.Wav2Vec2(
+            STT_CT2_MODEL_PATH, device="cpu", compute_type="int8", intra_threads=os.cpu_count()
+        )
+        print("INT8 CTranslate2 STT model loaded successfully.")
+    except Exception as e:
+        print(f"Error loading CTranslate2 STT model, falling back to PyTorch: {e}")
+        stt_ct2_model = None
+
+# Optional: static INT8 TorchScript build of the STT model made with IPEX
+# (see scripts/quantize_stt_ipex.py). Loading it needs IPEX for the INT8 kernels.
+STT_IPEX_MODEL_PATH = "models/stt_ipex_int8.pt"
+stt_ipex_model = None
+if DEVICE == 'cpu' and stt_ov_model is None and stt_ct2_model is None and ipex is not None and os.path.exists(STT_IPEX_MODEL_PATH):
+    try:
+        stt_ipex_model = torch.jit.load(STT_IPEX_MODEL_PATH)
+        print("INT8 IPEX STT model loaded successfully.")
+    except Exception as e:
+        print(f"Error loading IPEX STT model, falling back to PyTorch: {e}")
+        stt_ipex_model = None
+
 # TTS: Gujarati Text to Gujarati Speech
 try:
     tts_tokenizer = AutoTokenizer.from_pretrained("facebook/mms-tts-guj")
-    tts_model = VitsModel.from_pretrained("facebook/mms-tts-guj")
+    tts_model = optimize_torch_model(VitsModel.from_pretrained("facebook/mms-tts-guj"))
     print("TTS Model and tokenizer loaded successfully.")
 except Exception as e:
     print(f"Error loading TTS model: {e}")
     tts_tokenizer = None
     tts_model = None
 
+# Optional: dynamically quantized INT8 ONNX build of the TTS model (see scripts/quantize_tts.py).
+# When present it replaces the PyTorch forward pass in synthesize_waveform.
+TTS_ORT_MODEL_PATH = "models/tts_int8.onnx"
+tts_ort_session = None
+if DEVICE == 'cpu' and os.path.exists(TTS_ORT_MODEL_PATH):
+    try:
+        import onnxruntime as ort
+        sess_options = ort.SessionOptions()
+        sess_options.intra_op_num_threads = os.cpu_count()
+        tts_ort_session = ort.InferenceSession(
+            TTS_ORT_MODEL_PATH, sess_options=sess_options, providers=["CPUExecutionProvider"]
+        )
+        tts_ort_input_names = {i.name for i in tts_ort_session.get_inputs()}
+        print("INT8 ONNX TTS model loaded successfully.")
+    except Exception as e:
+        print(f"Error loading ONNX TTS model, falling back to PyTorch: {e}")
+        tts_ort_session = None
+
 # New: Initialize DeepTranslator models
 try:
     # GoogleTranslator uses simple language codes: 'gu' for Gujarati and 'en' for English
@@ -57,22 +193,249 @@ TARGET_SAMPLE_RATE = 16000 # The STT model's required sample rate
 # URL of your FastAPI backend
 FASTAPI_URL = "http://127.0.0.1:8000/api/query"
 
+# A shared session keeps connections to the backend alive between queries,
+# so each call skips the TCP (and TLS) handshake.
+llm_session = requests.Session()
+llm_session.headers.update({"Content-Type": "application/json"})
+llm_session.mount("http://", HTTPAdapter(pool_connections=8, pool_maxsize=32))
+llm_session.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=32))
+
+def decode_audio(data: bytes) -> np.ndarray:
+    """Decodes a compressed (WebM/Ogg Opus) recording to a 16 kHz mono float32 waveform."""
+    resampler = av.AudioResampler(format='flt', layout='mono', rate=TARGET_SAMPLE_RATE)
+    samples = []
+    with av.open(io.BytesIO(data)) as container:
+        for frame in container.decode(audio=0):
+            samples.extend(f.to_ndarray().reshape(-1) for f in resampler.resample(frame))
+        # Flush any samples still buffered in the resampler
+        samples.extend(f.to_ndarray().reshape(-1) for f in resampler.resample(None))
+    return np.concatenate(samples) if samples else np.empty(0, dtype=np.float32)
+
+class DynamicBatcher:
+    """
+    Collects model requests from concurrent sessions and runs them through
+    `process_batch` together, so one batched forward pass replaces several
+    single-sample ones. A background task drains the queue every `max_wait`
+    seconds and runs the batch in a worker thread; callers await their own result.
+    """
+    def __init__(self, process_batch, max_batch_size: int = 8, max_wait: float = 0.02):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = None
+        self.worker = None
+
+    async def submit(self, item):
+        """Queues a single item and waits for its result."""
+        if self.worker is None:
+            # Created lazily so they bind to the running event loop
+            self.queue = asyncio.Queue()
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self._run())
+        done = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, done))
+        return await done
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            # Give other sessions a short window to join this batch
+            await asyncio.sleep(self.max_wait)
+            while len(batch) < self.max_batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            # Callers that were cancelled meanwhile (client disconnects, timeouts) are dropped
+            batch = [(item, done) for item, done in batch if not done.cancelled()]
+            if not batch:
+                continue
+            try:
+                results = list(await asyncio.to_thread(self.process_batch, [item for item, _ in batch]))
+                if len(results) != len(batch):
+                    raise RuntimeError(f"expected {len(batch)} results, got {len(results)}")
+            except Exception as e:
+                print(f"Error processing batch of {len(batch)}: {e}")
+                for _, done in batch:
+                    if not done.done():
+                        done.set_exception(e)
+                continue
+            # A caller may also be cancelled while its batch runs
+            for (_, done), result in zip(batch, results):
+                if not done.done():
+                    done.set_result(result)
+
+def _bucket_length(num_samples: int) -> int:
+    """Rounds an audio length up to the next power of two."""
+    return 1 << max(num_samples - 1, 0).bit_length()
+
+def _transcribe_batch(audio_inputs: list[np.ndarray]) -> list[str]:
+    """Runs the PyTorch STT model on a padded batch of waveforms."""
+    if DEVICE == 'cuda':
+        # Pad to power-of-two lengths so the compiled model sees only a handful of
+        # shapes and can reuse its captured CUDA graphs
+        padding = {"padding": "max_length", "max_length": _bucket_length(max(len(a) for a in audio_inputs))}
+    else:
+        padding = {"padding": True}
+    features = stt_processor(
+        audio_inputs, sampling_rate=TARGET_SAMPLE_RATE, return_tensors="pt", **padding
+    )
+    attention_mask = features.get("attention_mask")
+    with torch.inference_mode(), inference_context():
+        logits = stt_model(
+            features.input_values.to(DEVICE),
+            attention_mask=attention_mask.to(DEVICE) if attention_mask is not None else None
+        ).logits
+    predicted_ids = torch.argmax(logits, dim=-1).cpu()
+    # Drop the frames that only cover padding before decoding each sample
+    frame_counts = stt_model._get_feat_extract_output_lengths(
+        torch.tensor([len(audio) for audio in audio_inputs])
+    ).tolist()
+    return [
+        stt_processor.decode(ids[:n], skip_special_tokens=True)
+        for ids, n in zip(predicted_ids, frame_counts)
+    ]
+
+def _synthesize_batch(texts: list[str]) -> list[np.ndarray]:
+    """Runs the PyTorch TTS model on a padded batch of texts."""
+    inputs = tts_tokenizer(texts, return_tensors="pt", padding=True).to(DEVICE)
+    with torch.inference_mode(), inference_context():
+        outputs = tts_model(**inputs)
+    # On CPU, .float() only copies when autocast produced bfloat16 (which NumPy lacks) and
+    # .cpu() is a no-op, so .numpy() is a zero-copy view and each row slice below is a view into it.
+    waveforms = outputs.waveform.float().cpu().numpy()
+    return [waveforms[i, :n] for i, n in enumerate(outputs.sequence_lengths.tolist())]
+
+stt_batcher = DynamicBatcher(_transcribe_batch)
+tts_batcher = DynamicBatcher(_synthesize_batch)
+
+async def transcribe_audio(audio_input: np.ndarray) -> str:
+    """Runs STT on a 16 kHz mono waveform and returns the decoded (Devanagari) text."""
+    if stt_ov_model is None and stt_ct2_model is None and stt_ipex_model is None:
+        return await stt_batcher.submit(audio_input)
+    return await asyncio.to_thread(_transcribe_single, audio_input)
+
+def _transcribe_single(audio_input: np.ndarray) -> str:
+    """Runs one waveform through whichever accelerated STT backend is loaded."""
+    input_values = stt_processor(
+        audio_input, sampling_rate=TARGET_SAMPLE_RATE, return_tensors="pt"
+    ).input_values
+
+    if stt_ov_model is not None:
+        logits = stt_ov_model([input_values.numpy()])[0]
+        predicted_ids = np.argmax(logits, axis=-1)
+    elif stt_ct2_model is not None:
+        features = ctranslate2.StorageView.from_array(np.ascontiguousarray(input_values.numpy()))
+        logits = np.array(stt_ct2_model.encode(features))
+        predicted_ids = np.argmax(logits, axis=-1)
+    else:
+        with torch.inference_mode():
+            logits = stt_ipex_model(input_values)[0]
+        predicted_ids = torch.argmax(logits, dim=-1)
+    return stt_processor.decode(predicted_ids[0], skip_special_tokens=True)
+
+# Assistant answers repeat often, so synthesized sentences are kept in a small LRU
+# cache (~200 KB each). Cached waveforms are read-only; callers copy before editing.
+TTS_CACHE_SIZE = 256
+_tts_cache = OrderedDict()
+
+async def synthesize_waveform(text: str) -> np.ndarray:
+    """Runs TTS on Gujarati text and returns a read-only 1-D float waveform."""
+    key = " ".join(text.split())
+    speech_np = _tts_cache.get(key)
+    if speech_np is not None:
+        _tts_cache.move_to_end(key)
+        return speech_np
+
+    if tts_ort_session is not None:
+        speech_np = await asyncio.to_thread(_synthesize_ort, key)
+    else:
+        speech_np = await tts_batcher.submit(key)
+
+    speech_np.flags.writeable = False
+    _tts_cache[key] = speech_np
+    if len(_tts_cache) > TTS_CACHE_SIZE:
+        _tts_cache.popitem(last=False)
+    return speech_np
+
+def _synthesize_ort(text: str) -> np.ndarray:
+    """Runs one text through the ONNX Runtime TTS session."""
+    inputs = tts_tokenizer(text, return_tensors="np")
+    ort_inputs = {k: v for k, v in inputs.items() if k in tts_ort_input_names}
+    # Take the single batch row as a view rather than squeeze()-ing the array
+    return tts_ort_session.run(None, ort_inputs)[0][0]
+
+# --- Devanagari to Gujarati Transliteration ---
+# The two Unicode blocks share the same layout (Gujarati = Devanagari + 0x180), and
+# virama/matra handling is identical, so conjuncts carry over codepoint by codepoint.
+# A str.translate table does the whole conversion in one C-level pass.
+_GUJARATI_OFFSET = 0x0A80 - 0x0900
+_GUJARATI_NUKTA = '\u0ABC'
+
+def _build_devanagari_to_gujarati() -> dict:
+    """Builds the codepoint table used by `devanagari_to_gujarati`."""
+    table = {}
+    for code in range(0x0900, 0x0980):
+        target = chr(code + _GUJARATI_OFFSET)
+        if unicodedata.name(target, None) is not None:
+            table[code] = target
+
+    # Dandas are shared with Devanagari and are left as-is
+    table.pop(0x0964, None)
+    table.pop(0x0965, None)
+
+    # Letters with no precomposed Gujarati form become base letter + nukta
+    for code, base in {0x0929: 0x0928, 0x0931: 0x0930, 0x0934: 0x0933,
+                       0x0958: 0x0915, 0x0959: 0x0916, 0x095A: 0x0917, 0x095B: 0x091C,
+                       0x095C: 0x0921, 0x095D: 0x0922, 0x095E: 0x092B, 0x095F: 0x092F}.items():
+        table[code] = chr(base + _GUJARATI_OFFSET) + _GUJARATI_NUKTA
+    return table
+
+_DEV_TO_GUJ = str.maketrans(_build_devanagari_to_gujarati())
+
+def devanagari_to_gujarati(text: str) -> str:
+    """Converts the STT model's Devanagari output to Gujarati script."""
+    return text.translate(_DEV_TO_GUJ)
+
+# Repeated questions are common, so translations are memoized. Keys are
+# whitespace-normalized only: case matters to the translators. Failed calls raise
+# and are therefore never cached. Assistant answers are not memoized here: some
+# depend on the database and the clock, and the backend caches RAG answers itself.
+RESPONSE_CACHE_SIZE = 4096
+
+def normalize_text(text: str) -> str:
+    """Collapses runs of whitespace so trivially different inputs share a cache entry."""
+    return " ".join(text.split())
+
+@lru_cache(maxsize=RESPONSE_CACHE_SIZE)
+def translate_guj_en(text: str) -> str:
+    """Translates Gujarati text to English."""
+    return guj_en_translator.translate(text)
+
+@lru_cache(maxsize=RESPONSE_CACHE_SIZE)
+def translate_en_guj(text: str) -> str:
+    """Translates English text to Gujarati."""
+    return en_guj_translator.translate(text)
+
+def _query_assistant(query: str) -> str:
+    """Posts a query to the FastAPI backend; raises on any HTTP/connection error."""
+    payload = {"query": query, "role": "student"}
+    response = llm_session.post(FASTAPI_URL, json=payload, timeout=60)
+    response.raise_for_status()
+    return response.json().get("answer", "I'm sorry, I couldn't get a response from the AI assistant.")
+
 def get_llm_response(query: str) -> str:
     """Sends a query to the FastAPI backend and returns the English response."""
     try:
-        payload = {"query": query, "role": "student"}
-        headers = {"Content-Type": "application/json"}
-        response = requests.post(FASTAPI_URL, data=json.dumps(payload), headers=headers, timeout=60)
-        response.raise_for_status()
-        return response.json().get("answer", "I'm sorry, I couldn't get a response from the AI assistant.")
+        return _query_assistant(normalize_text(query))
     except requests.exceptions.RequestException as e:
         print(f"Error communicating with FastAPI backend: {e}")
         return "I'm sorry, I am unable to connect to my knowledge base right now. Please try again."
 
-@app.route('/')
+@fastapi_app.get('/', response_class=HTMLResponse)
 def index():
     """Renders the single-page HTML application."""
-    return render_template_string("""
+    return INDEX_HTML
+
+INDEX_HTML = """
 <!DOCTYPE html>
 <html lang="en">
 <head>
@@ -157,8 +520,9 @@ def index():
         const errorMessage = document.getElementById('errorMessage');
 
         let socket;
-        let audioContext;
-        let scriptProcessor;
+        let mediaStream;
+        let mediaRecorder;
+        let pendingChunk = Promise.resolve();
         let isRecording = false;
         let ttsAudioQueue = [];
         let isPlaying = false;
@@ -176,6 +540,25 @@ def index():
             translationOutput.innerHTML = '<p>Final translation will appear here...</p>';
         }
 
+        // Opus at 16 kbps is ~30x smaller than raw Float32 PCM; Firefox only records Ogg
+        const OPUS_MIME_TYPES = ['audio/webm;codecs=opus', 'audio/ogg;codecs=opus'];
+
+        function stopMicrophone() {
+            if (mediaStream) {
+                mediaStream.getTracks().forEach(track => track.stop());
+                mediaStream = null;
+            }
+        }
+
+        function discardRecorder() {
+            if (mediaRecorder && mediaRecorder.state !== 'inactive') {
+                mediaRecorder.ondataavailable = null;
+                mediaRecorder.onstop = null;
+                mediaRecorder.stop();
+            }
+            stopMicrophone();
+        }
+
         function playNextAudio() {
             if (ttsAudioQueue.length > 0 && !isPlaying) {
                 isPlaying = true;
@@ -199,24 +582,37 @@ def index():
                 recordButton.classList.add('bg-indigo-600', 'hover:bg-indigo-700');
                 statusElement.textContent = "Stopping...";
                 cancelButton.classList.add('hidden');
-                if (socket) {
-                    socket.emit('end_stream');
-                    scriptProcessor.disconnect();
-                    audioContext.close();
+                if (socket && mediaRecorder) {
+                    // 'end_stream' is sent from onstop, once the final chunk has been flushed
+                    mediaRecorder.stop();
                 }
             } else {
                 try {
                     errorBox.classList.add('hidden');
-                    const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
-
-                    audioContext = new AudioContext({ sampleRate: 16000 });
-                    const source = audioContext.createMediaStreamSource(stream);
-                    scriptProcessor = audioContext.createScriptProcessor(4096, 1, 1);
-
-                    source.connect(scriptProcessor);
-                    scriptProcessor.connect(audioContext.destination);
-
-                    socket = io();
+                    mediaStream = await navigator.mediaDevices.getUserMedia({ audio: true });
+
+                    const mimeType = OPUS_MIME_TYPES.find(type => MediaRecorder.isTypeSupported(type));
+                    mediaRecorder = new MediaRecorder(mediaStream, { mimeType, audioBitsPerSecond: 16000 });
+                    pendingChunk = Promise.resolve();
+
+                    // Chain the uploads so chunks (and end_stream) reach the server in order
+                    mediaRecorder.ondataavailable = (event) => {
+                        if (event.data.size === 0) {
+                            return;
+                        }
+                        pendingChunk = pendingChunk.then(async () => {
+                            socket.emit('audio_chunk', await event.data.arrayBuffer());
+                        });
+                    };
+
+                    mediaRecorder.onstop = () => {
+                        stopMicrophone();
+                        pendingChunk.then(() => socket.emit('end_stream'));
+                    };
+
+                    // WebSocket only: with several server workers, long-polling requests
+                    // could land on a worker that doesn't own the session
+                    socket = io({ transports: ['websocket'] });
                     
                     socket.on('connect', () => {
                         console.log('Connected to server via WebSocket');
@@ -230,24 +626,32 @@ def index():
                         englishTranslationOutput.innerHTML = '<p></p>';
                         translationOutput.innerHTML = '<p></p>';
 
-                        scriptProcessor.onaudioprocess = function(event) {
-                            const inputBuffer = event.inputBuffer.getChannelData(0);
-                            const float32Array = new Float32Array(inputBuffer);
-                            socket.emit('audio_chunk', float32Array);
-                        };
+                        mediaRecorder.start(250);
                     });
 
-                    // Update this event handler to display all three text outputs
+                    // The server sends each stage of the pipeline as soon as it is ready
                     socket.on('transcription', (data) => {
                         console.log('Transcription received:', data);
                         transcriptionOutput.innerHTML = `<p>${data.original_text}</p>`;
+                        englishTranslationOutput.innerHTML = `<p>${data.english_text ?? 'Translating...'}</p>`;
+                        translationOutput.innerHTML = `<p>${data.translated_text ?? 'Waiting for the assistant...'}</p>`;
+                    });
+
+                    socket.on('english_text', (data) => {
                         englishTranslationOutput.innerHTML = `<p>${data.english_text}</p>`;
+                    });
+
+                    socket.on('translated_text', (data) => {
                         translationOutput.innerHTML = `<p>${data.translated_text}</p>`;
-                        socket.emit('tts_request', { text: data.translated_text });
                     });
                     
+                    // Audio arrives as one WAV chunk per sentence, in order
                     socket.on('tts_response', (data) => {
-                        const audioBlob = new Blob([new Uint8Array(data.audio_data)], { type: 'audio/mpeg' });
+                        if (data.error) {
+                            console.error('TTS error:', data.error);
+                            return;
+                        }
+                        const audioBlob = new Blob([new Uint8Array(data.audio_data)], { type: data.mime || 'audio/wav' });
                         ttsAudioQueue.push(audioBlob);
                         playNextAudio();
                     });
@@ -255,8 +659,7 @@ def index():
                     socket.on('disconnect', () => {
                         console.log('Disconnected from server');
                         statusElement.textContent = "Disconnected";
-                        scriptProcessor.disconnect();
-                        audioContext.close();
+                        discardRecorder();
                     });
 
                     socket.on('connect_error', (err) => {
@@ -280,9 +683,8 @@ def index():
                 statusElement.textContent = "Ready";
                 cancelButton.classList.add('hidden');
                 if (socket) {
+                    discardRecorder();
                     socket.emit('cancel_stream');
-                    scriptProcessor.disconnect();
-                    audioContext.close();
                 }
                 resetOutputs();
             }
@@ -332,189 +734,256 @@ def index():
     </script>
 </body>
 </html>
-""")
+"""
+
+# Samples per MP3 frame; feeding the encoder this many at a time lets each packet be
+# sent as soon as it is encoded instead of after the whole clip
+MP3_FRAME_SAMPLES = 1152
+
+def iter_mp3(speech_np: np.ndarray, sampling_rate: int):
+    """
+    Encodes a waveform as MP3 with FFmpeg (via PyAV), feeding it one MP3 frame of
+    samples at a time and yielding each encoded packet as soon as it is ready. Raw
+    MP3 frames concatenate into a valid stream, so no container or whole-file buffer
+    is needed. Errors are logged here because, once streaming has started, they can
+    only abort the response.
+    """
+    try:
+        encoder = av.CodecContext.create('mp3', 'w')
+        encoder.sample_rate = sampling_rate
+        encoder.layout = 'mono'
+        encoder.format = 'fltp'
+
+        samples = speech_np.astype(np.float32, copy=False).reshape(1, -1)
+        for start in range(0, samples.shape[1], MP3_FRAME_SAMPLES):
+            frame = av.AudioFrame.from_ndarray(
+                np.ascontiguousarray(samples[:, start:start + MP3_FRAME_SAMPLES]), format='fltp', layout='mono'
+            )
+            frame.sample_rate = sampling_rate
+            frame.pts = start
+            for packet in encoder.encode(frame):
+                yield bytes(packet)
+        # None flushes the samples still buffered in the encoder
+        for packet in encoder.encode(None):
+            yield bytes(packet)
+    except Exception as e:
+        print(f"MP3 encoding error: {e}")
+        raise
 
-@app.route('/tts', methods=['POST'])
-def tts_synthesis():
+def encode_wav(speech_np: np.ndarray, sampling_rate: int) -> bytes:
+    """Encodes a waveform as 16-bit PCM WAV: a header plus the raw samples."""
+    buffer = io.BytesIO()
+    sf.write(buffer, speech_np, sampling_rate, format='wav', subtype='PCM_16')
+    return buffer.getvalue()
+
+@fastapi_app.post('/tts')
+async def tts_synthesis(request: Request):
     """Endpoint for Text-to-Speech synthesis."""
     if tts_tokenizer is None or tts_model is None:
-        return {"error": "TTS model not loaded on server."}, 500
+        return JSONResponse({"error": "TTS model not loaded on server."}, status_code=500)
         
-    data = request.json
+    data = await request.json()
     text = data.get('text', '')
     if not text:
-        return {"error": "No text provided."}, 400
+        return JSONResponse({"error": "No text provided."}, status_code=400)
 
     try:
-        inputs = tts_tokenizer(text, return_tensors="pt")
-        
-        with torch.no_grad():
-            speech_tensor = tts_model(**inputs).waveform
-        
-        speech_np = speech_tensor.cpu().numpy().squeeze()
-        
-        buffer = io.BytesIO()
-        sf.write(buffer, speech_np, tts_model.config.sampling_rate, format='mp3')
-        buffer.seek(0)
-        
-        return Response(buffer.read(), mimetype='audio/mpeg')
+        speech_np = await synthesize_waveform(text)
+        # Pull the first packet here, so a failure to open or run the encoder still
+        # gets a JSON error instead of a truncated stream. The rest of the generator is
+        # iterated in a worker thread and each packet is sent as soon as it is encoded.
+        packets = iter_mp3(speech_np, tts_model.config.sampling_rate)
+        first_packet = await asyncio.to_thread(next, packets, b'')
+        return StreamingResponse(itertools.chain((first_packet,), packets), media_type='audio/mpeg')
 
     except Exception as e:
         print(f"TTS error: {e}")
-        return {"error": "An error occurred during TTS synthesis."}, 500
-
-@socketio.on('tts_request')
-def handle_tts_request(data):
-    """Handles TTS requests from transcription, and sends audio back via WebSocket."""
-    session_id = request.sid
-    text = data.get('text', '')
-
-    if not text:
-        return
-    
+        return JSONResponse({"error": "An error occurred during TTS synthesis."}, status_code=500)
+
+# Sentence boundaries (Gujarati danda and Latin punctuation) used to stream TTS audio
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[।.?!])\s+')
+TTS_FADE_IN_SECONDS = 0.02 # Short fade at each chunk start to hide boundary clicks
+
+def split_sentences(text: str) -> list[str]:
+    """Splits text into sentence-sized chunks for incremental synthesis."""
+    return [part.strip() for part in _SENTENCE_SPLIT_RE.split(text) if part.strip()]
+
+async def emit_tts_audio(session_id: str, text: str):
+    """
+    Synthesizes `text` sentence by sentence and sends each chunk to the given
+    session as soon as it is ready, so playback starts after the first sentence
+    instead of after the whole utterance.
+    """
     if tts_tokenizer is None or tts_model is None:
-        emit('tts_response', {'error': 'TTS model not loaded on server.'}, room=session_id)
+        await sio.emit('tts_response', {'error': 'TTS model not loaded on server.'}, to=session_id)
         return
 
+    sentences = split_sentences(text)
+    sampling_rate = tts_model.config.sampling_rate
+    fade_samples = int(TTS_FADE_IN_SECONDS * sampling_rate)
+
     try:
-        inputs = tts_tokenizer(text, return_tensors="pt")
-        
-        with torch.no_grad():
-            speech_tensor = tts_model(**inputs).waveform
-        
-        speech_np = speech_tensor.cpu().numpy().squeeze()
-        
-        buffer = io.BytesIO()
-        sf.write(buffer, speech_np, tts_model.config.sampling_rate, format='mp3')
-        buffer.seek(0)
-        
-        emit('tts_response', {'audio_data': buffer.getvalue()}, room=session_id)
+        for seq, sentence in enumerate(sentences):
+            speech_np = (await synthesize_waveform(sentence)).copy()
+            fade = min(fade_samples, len(speech_np))
+            speech_np[:fade] *= np.linspace(0.0, 1.0, fade, dtype=speech_np.dtype)
+
+            # WAV is far cheaper per chunk than MP3 and the browser decodes both equally fast
+            await sio.emit('tts_response', {
+                'audio_data': encode_wav(speech_np, sampling_rate),
+                'mime': 'audio/wav',
+                'seq': seq,
+                'final': seq == len(sentences) - 1
+            }, to=session_id)
 
     except Exception as e:
         print(f"TTS error during real-time synthesis for session {session_id}: {e}")
-        emit('tts_response', {'error': 'An error occurred during TTS synthesis.'}, room=session_id)
+        await sio.emit('tts_response', {'error': 'An error occurred during TTS synthesis.'}, to=session_id)
+
+# asyncio only keeps weak references to tasks, so running pipelines are held here
+# until they finish; otherwise one could be garbage-collected mid-run.
+_pipeline_tasks = set()
+
+def _pipeline_task_done(task: asyncio.Task):
+    """Releases a finished pipeline task and logs any exception it ended with."""
+    _pipeline_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Response pipeline failed: {task.exception()!r}")
+
+async def run_response_pipeline(session_id: str, gujarati_text: str):
+    """
+    Runs the network-bound stages (translation, AI assistant call, back-translation
+    and TTS) in a background task, emitting each result as soon as it is ready so
+    the client is not blocked on the sum of all stages.
+    """
+    try:
+        # Step 2: Gujarati Text to English Text
+        if guj_en_translator:
+            en_translation = await asyncio.to_thread(translate_guj_en, normalize_text(gujarati_text))
+        else:
+            en_translation = "Translation model not loaded."
+        
+        print(f"English Translation: {en_translation}")
+        await sio.emit('english_text', {'english_text': en_translation}, to=session_id)
+            
+        # Step 2.5: Get response from AI assistant
+        llm_response_en = await asyncio.to_thread(get_llm_response, en_translation)
+        print(f"AI Assistant Response (English): {llm_response_en}")
 
+        # Step 3: English Text to Gujarati Text (round-trip)
+        if en_guj_translator:
+            gujarati_translation = await asyncio.to_thread(translate_en_guj, normalize_text(llm_response_en))
+        else:
+            gujarati_translation = "Translation model not loaded."
+
+        print(f"Final Gujarati Translation: {gujarati_translation}")
+        await sio.emit('translated_text', {'translated_text': gujarati_translation}, to=session_id)
 
-@socketio.on('connect')
-def handle_connect():
+    except Exception as e:
+        print(f"Translation/response error for session {session_id}: {e}")
+        await sio.emit('translated_text', {
+            'translated_text': 'An error occurred while generating the response.'
+        }, to=session_id)
+        return
+
+    # Step 4: Gujarati Text to Gujarati Speech
+    await emit_tts_audio(session_id, gujarati_translation)
+
+@sio.on('tts_request')
+async def handle_tts_request(sid, data):
+    """Handles TTS requests from the client, and sends audio back via WebSocket."""
+    text = data.get('text', '')
+    if not text:
+        return
+    await emit_tts_audio(sid, text)
+
+
+@sio.on('connect')
+async def handle_connect(sid, environ):
     """Initializes the audio buffer for the new session."""
-    session_id = request.sid
-    session_data[session_id] = {
-        'buffer': np.array([], dtype=np.float32)
+    # Compressed chunks are collected in a list and decoded once at the end of the stream,
+    # so ingestion stays linear in the length of the recording.
+    session_data[sid] = {
+        'chunks': [],
+        'num_bytes': 0
     }
-    print(f"Client connected with session ID: {session_id}")
+    print(f"Client connected with session ID: {sid}")
 
-@socketio.on('audio_chunk')
-def handle_audio_chunk(data):
-    """Handles incoming raw audio chunks and appends them to the buffer."""
-    session_id = request.sid
-    
-    if session_id not in session_data:
+@sio.on('audio_chunk')
+async def handle_audio_chunk(sid, data):
+    """Handles incoming Opus-encoded audio chunks and appends them to the buffer."""
+    if sid not in session_data:
         return
 
-    chunk = np.frombuffer(data, dtype=np.float32)
-    session_data[session_id]['buffer'] = np.concatenate((session_data[session_id]['buffer'], chunk))
+    session_data[sid]['chunks'].append(data)
+    session_data[sid]['num_bytes'] += len(data)
 
-@socketio.on('end_stream')
-def handle_end_stream():
+@sio.on('end_stream')
+async def handle_end_stream(sid):
     """Handles the end of the audio stream and processes the entire buffer."""
-    session_id = request.sid
-    
-    if session_id not in session_data or len(session_data[session_id]['buffer']) == 0:
-        emit('transcription', {
+    if sid not in session_data or session_data[sid]['num_bytes'] == 0:
+        await sio.emit('transcription', {
             'original_text': 'No audio recorded.',
             'english_text': '',
             'translated_text': ''
-        }, room=session_id)
-        if session_id in session_data:
-            del session_data[session_id]
-        print(f"Stream ended, no audio for session {session_id}")
+        }, to=sid)
+        if sid in session_data:
+            del session_data[sid]
+        print(f"Stream ended, no audio for session {sid}")
         return
     
     if stt_processor is None or stt_model is None:
-        emit('transcription', {'original_text': 'STT model not loaded on server.', 'english_text': '', 'translated_text': ''}, room=session_id)
-        if session_id in session_data:
-            del session_data[session_id]
+        await sio.emit('transcription', {'original_text': 'STT model not loaded on server.', 'english_text': '', 'translated_text': ''}, to=sid)
+        if sid in session_data:
+            del session_data[sid]
         return
 
+    # Take the buffer now so a concurrent cancel/disconnect can't race the decode below
+    chunks = session_data.pop(sid)['chunks']
+
     try:
-        audio_input = session_data[session_id]['buffer']
+        audio_input = await asyncio.to_thread(decode_audio, b"".join(chunks))
         
         # Step 1: STT (Gujarati speech to Gujarati text)
-        input_values = stt_processor(
-            audio_input, sampling_rate=TARGET_SAMPLE_RATE, return_tensors="pt"
-        ).input_values
-        
-        logits = stt_model(input_values).logits
-        predicted_ids = torch.argmax(logits, dim=-1)
-        gujarati_transcription = stt_processor.decode(predicted_ids[0], skip_special_tokens=True)
+        gujarati_transcription = await transcribe_audio(audio_input)
         print(f"STT Output (Devanagari): {gujarati_transcription}")
         
         # Transliterate from Devanagari to Gujarati script
-        transliterated_gujarati_text = transliterate(
-            gujarati_transcription,
-            sanscript.DEVANAGARI,
-            sanscript.GUJARATI
-        )
+        transliterated_gujarati_text = devanagari_to_gujarati(gujarati_transcription)
         print(f"Transliterated Text (Gujarati): {transliterated_gujarati_text}")
 
-        # Step 2: Gujarati Text to English Text
-        if guj_en_translator:
-            en_translation = guj_en_translator.translate(transliterated_gujarati_text)
-        else:
-            en_translation = "Translation model not loaded."
-        
-        print(f"English Translation: {en_translation}")
-            
-        # Step 2.5: Get response from AI assistant
-        llm_response_en = get_llm_response(en_translation)
-        print(f"AI Assistant Response (English): {llm_response_en}")
-
-        # Step 3: English Text to Gujarati Text (round-trip)
-        if en_guj_translator:
-            gujarati_translation = en_guj_translator.translate(llm_response_en)
-        else:
-            gujarati_translation = "Translation model not loaded."
-
-        print(f"Final Gujarati Translation: {gujarati_translation}")
-
-        # Emit transcription results back to the client
-        emit('transcription', {
-            'original_text': transliterated_gujarati_text,
-            'english_text': en_translation,
-            'translated_text': gujarati_translation
-        }, room=session_id)
+        # Send the transcription right away; the remaining stages run in the background
+        await sio.emit('transcription', {'original_text': transliterated_gujarati_text}, to=sid)
+        task = asyncio.create_task(run_response_pipeline(sid, transliterated_gujarati_text))
+        _pipeline_tasks.add(task)
+        task.add_done_callback(_pipeline_task_done)
 
     except Exception as e:
-        print(f"Transcription/translation error for session {session_id}: {e}")
-        emit('transcription', {
+        print(f"Transcription error for session {sid}: {e}")
+        await sio.emit('transcription', {
             'original_text': 'An error occurred during transcription.',
             'english_text': '',
             'translated_text': ''
-        }, room=session_id)
+        }, to=sid)
     
-    if session_id in session_data:
-        del session_data[session_id]
-    print(f"Stream ended, buffer for session {session_id} cleared.")
+    print(f"Stream ended, buffer for session {sid} cleared.")
 
-@socketio.on('cancel_stream')
-def handle_cancel_stream():
+@sio.on('cancel_stream')
+async def handle_cancel_stream(sid):
     """Clears the buffer without processing."""
-    session_id = request.sid
-    if session_id in session_data:
-        del session_data[session_id]
-    print(f"Stream cancelled, buffer for session {session_id} cleared.")
+    if sid in session_data:
+        del session_data[sid]
+    print(f"Stream cancelled, buffer for session {sid} cleared.")
 
-@socketio.on('disconnect')
-def handle_disconnect():
+@sio.on('disconnect')
+async def handle_disconnect(sid):
     """Cleans up the buffer when a client disconnects."""
-    session_id = request.sid
-    if session_id in session_data:
-        del session_data[session_id]
-    print(f"Client disconnected with session ID: {session_id}")
+    if sid in session_data:
+        del session_data[sid]
+    print(f"Client disconnected with session ID: {sid}")
 
 if __name__ == '__main__':
     print("Starting the real-time transcription server...")
     print("Please go to http://127.0.0.1:5001 in your web browser.")
-    socketio.run(app, debug=True, port=5001)
-    
\ No newline at end of file
+    # uvicorn picks uvloop automatically when it is installed
+    uvicorn.run(app, host="127.0.0.1", port=5001)
@@ -1,11 +1,20 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from app.db.database import get_db
-from app.services.query_service import handle_query_logic
+from starlette.concurrency import run_in_threadpool
+from app.services.query_service import ahandle_query_logic, astream_query_logic, get_query_service
 
-app = FastAPI(title="College AI Assistant API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the embedding model, FAISS index and RAG chain before serving the first request
+    await run_in_threadpool(get_query_service)
+    yield
+
+app = FastAPI(title="College AI Assistant API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,6 +33,12 @@ def read_root():
     return {"message": "Welcome to the College AI Assistant API"}
 
 @app.post("/api/query")
-def handle_query(request: QueryRequest, db: Session = Depends(get_db)):
-    response_text = handle_query_logic(request.query, request.role, db)
-    return {"answer": response_text}
\ No newline at end of file
+async def handle_query(request: QueryRequest, db: Session = Depends(get_db)):
+    response_text = await ahandle_query_logic(request.query, request.role, db)
+    return {"answer": response_text}
+
+@app.post("/api/query/stream")
+async def stream_query(request: QueryRequest, db: Session = Depends(get_db)):
+    # Database lookups finish before streaming starts; only the LLM output is streamed
+    chunks = await astream_query_logic(request.query, request.role, db)
+    return StreamingResponse(chunks, media_type="text/plain; charset=utf-8")
\ No newline at end of file
@@ -1,5 +1,5 @@
 # app/db/models.py
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Index, func
 from sqlalchemy.orm import relationship
 from .database import Base
 
@@ -24,6 +24,13 @@ class User(Base):
     # Relationship to the Attendance model
     attendance = relationship("Attendance", back_populates="user")
 
+# Case-insensitive lookups compare LOWER(column), so index those expressions;
+# plain column indexes can't serve them
+Index('ix_users_exam_no_lower', func.lower(User.exam_no))
+Index('ix_users_student_id_lower', func.lower(User.student_id))
+# Serves the exact-name and name-prefix (range) stages of the student lookup
+Index('ix_users_name_lower', func.lower(User.name))
+
 class Attendance(Base):
     """Defines the Attendance model for the database."""
     __tablename__ = 'attendance'
@@ -31,7 +38,7 @@ class Attendance(Base):
     id = Column(Integer, primary_key=True, index=True)
     subject = Column(String, index=True)
     percentage = Column(Float)
-    user_id = Column(Integer, ForeignKey('users.id'))
+    user_id = Column(Integer, ForeignKey('users.id'), index=True)
 
     # --- ADDED ---
     # Defines the other side of the relationship
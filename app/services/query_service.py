@@ -2,12 +2,66 @@
 A robust query service that combines fast,
 accurate database lookups with the broad knowledge of the RAG system.
 """
+import asyncio
+import logging
 import re
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.orm import Session, joinedload, load_only
 from app.db.models import User, Attendance
-from app.services.rag_service import get_rag_chain
-from typing import Optional
-from datetime import datetime, time
+from app.services.rag_service import get_rag_chain, get_retriever, RAG_CONFIG_VERSION
+from app.services.rag_cache import SmartRAGCache
+from typing import AsyncIterator, Optional
+from starlette.concurrency import run_in_threadpool
+from datetime import time
+from time import monotonic
+from functools import lru_cache
+
+# Per-request diagnostics go through logging (DEBUG, off by default) rather than
+# print, so the hot path doesn't write to and lock stdout on every query
+logger = logging.getLogger(__name__)
+
+# Single-pass scan for student identifiers. Exam numbers (e.g. IT116) and student IDs
+# (e.g. 22ITU...) match case-insensitively, and a student ID must contain a digit so
+# long ordinary words aren't taken for one; names are runs of capitalized words.
+_IDENT_RE = re.compile(
+    r'\b(?:(?P<id>(?i:IT\d{3}|(?=[A-Z]*\d)[A-Z0-9]{10,}))|(?P<name>[A-Z][a-z]+(?:\s[A-Z][a-z]+)*))\b'
+)
+# Capitalized words that are never student names
+_COMMON_WORDS = frozenset({'what', 'is', 'the', 'of', 'for', 'tell', 'me', 'provide'})
+# How long (seconds) the in-memory index of student name words is reused before reloading
+NAME_INDEX_TTL = 300
+
+# Timetable lookups: a day and time in the query, and the slot line in a timetable document
+_TIME_RE = re.compile(r'(?i)(monday|tuesday|wednesday|thursday|friday|saturday|sunday)\s+(?:at)?\s*(\d{1,2}(?::\d{2})?)\s*(am|pm)?')
+_DOC_RE = re.compile(r'For\s(.*?),\s+during\sthe\s(.*?)\sTO\s(.*?)\sslot')
+
+# Student questions answered straight from the database, one named group per intent
+_INTENT_RE = re.compile(r'(?P<attendance>attendance)|(?P<student_id>student\s*id)|(?P<exam_no>exam\s*n(?:o|umber))', re.I)
+
+# Timetable slots are written on a 12-hour clock without am/pm. Lectures run from the
+# morning into the early evening, so an hour up to this one without am/pm means PM.
+_LAST_AFTERNOON_HOUR = 7
+
+def _parse_clock(time_str: str, meridiem: Optional[str] = None) -> time:
+    """
+    Parses 'H', 'H:MM' or 'HH:MM'. With `meridiem` ('am'/'pm') the hour is on a
+    12-hour clock. Without it, hours 1 to _LAST_AFTERNOON_HOUR are college-hours PM
+    (so '2:30' is 14:30, as in the timetables) and other hours are taken as-is.
+    A hand parser is much cheaper than datetime.strptime; raises ValueError when invalid.
+    """
+    hours, _, minutes = time_str.partition(':')
+    hour, minute = int(hours), int(minutes or 0)
+    if meridiem:
+        if not 1 <= hour <= 12:
+            raise ValueError(f"invalid 12-hour time: {time_str}")
+        hour = hour % 12 + (12 if meridiem.lower() == 'pm' else 0)
+    elif 1 <= hour <= _LAST_AFTERNOON_HOUR:
+        hour += 12
+    return time(hour, minute)
+
+def _prefix_upper_bound(prefix: str) -> str:
+    """Returns the smallest string greater than every string starting with `prefix`."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
 
 class QueryService:
     """
@@ -18,43 +72,122 @@ class QueryService:
     def __init__(self):
         """Initializes the service and pre-loads the RAG chain."""
         print("Initializing QueryService and loading the RAG chain...")
-        self.rag_chain = get_rag_chain()
+        self.rag_cache = SmartRAGCache(RAG_CONFIG_VERSION, max_items=1024, ttl=600)
+        self._name_prefixes = None
+        self._name_prefixes_expire_at = 0.0
         if self.rag_chain:
             print("RAG chain loaded successfully.")
         else:
             print("CRITICAL: RAG chain could not be loaded. RAG queries will fail.")
 
+    @property
+    def rag_chain(self):
+        """
+        The shared RAG chain, or None while the vector store doesn't exist. Looked up
+        on each use so a store built after startup is used without a restart.
+        """
+        return get_rag_chain()
+
+    def _invoke_rag(self, rag_query: str, role: str) -> str:
+        """
+        Invokes the RAG chain for a whitespace-normalized version of the query.
+        Answers are cached so repeated questions skip the retrieval and LLM round-trip.
+        """
+        normalized_query = " ".join(rag_query.split())
+        key = self.rag_cache.make_key(normalized_query, role)
+        return self.rag_cache.get_or_compute(key, lambda: self.rag_chain.invoke(normalized_query).strip())
+
+    def _get_name_prefixes(self, db: Session) -> frozenset:
+        """
+        Returns every prefix of every word in the stored student names (lowercased).
+        A capitalized word whose lowercase form isn't in this set can't match any
+        student, so it is dropped without a database round-trip.
+        """
+        now = monotonic()
+        if self._name_prefixes is None or now >= self._name_prefixes_expire_at:
+            prefixes = set()
+            for (name,) in db.query(User.name).filter(User.name.isnot(None)):
+                for word in name.lower().split():
+                    prefixes.update(word[:end] for end in range(1, len(word) + 1))
+            self._name_prefixes = frozenset(prefixes)
+            self._name_prefixes_expire_at = now + NAME_INDEX_TTL
+        return self._name_prefixes
+
     def _find_user_from_query(self, query: str, db: Session) -> Optional[User]:
         """
         Tries to extract a potential student identifier (name, exam no, student id)
         from the user's query and finds the corresponding user in the database.
+
+        Attendance is only loaded when the query asks for it; otherwise only the id,
+        name, exam_no and student_id columns of the User are loaded.
         """
-        # Pattern to find exam numbers (e.g., IT116) or student IDs (e.g., 22ITU...)
-        id_pattern = r'\b(IT\d{3}|[A-Z0-9]{10,})\b'
-        # A simple pattern to find potential names (capitalized words)
-        name_pattern = r'\b([A-Z][a-z]+(?:\s[A-Z][a-z]+)*)\b'
-
-        potential_id = re.search(id_pattern, query, re.IGNORECASE)
-        if potential_id:
-            identifier = potential_id.group(1)
-            print(f"DEBUG: Found potential ID '{identifier}' in query.")
-            # Prioritize exact matches on ID/Exam No
-            return db.query(User).filter(
-                (User.exam_no.ilike(identifier)) | (User.student_id.ilike(identifier))
-            ).first()
-
-        # If no ID is found, look for names.
-        potential_names = re.findall(name_pattern, query)
-        # Filter out common non-name words
-        common_words = {'what', 'is', 'the', 'of', 'for', 'tell', 'me', 'provide'}
-        for name in potential_names:
-            if name.lower() not in common_words:
-                print(f"DEBUG: Found potential name '{name}' in query.")
-                # Search for the name in the database
-                user = db.query(User).filter(User.name.ilike(f"%{name}%")).first()
-                if user:
-                    return user # Return the first match
-        
+        # Collect every ID and name candidate in one scan. Candidates are lowercased
+        # once here and common non-name words skipped.
+        identifiers = []
+        potential_names = []
+        for match in _IDENT_RE.finditer(query):
+            if match.group('id'):
+                identifiers.append(match.group('id').lower())
+                continue
+            name = match.group('name').lower()
+            if name not in _COMMON_WORDS:
+                potential_names.append(name)
+
+        # Each candidate becomes a (condition, priority) pair so that one query per
+        # stage can try them all and return the best-ranked match.
+        exact = []
+        if identifiers:
+            logger.debug("Found potential IDs %s in query.", identifiers)
+        # IDs rank above names; per ID, prioritize exact matches on Exam No, then Student ID.
+        # Compare LOWER(column) so the functional indexes are used (same as ILIKE without wildcards)
+        for identifier in identifiers:
+            exact += [
+                (func.lower(User.exam_no) == identifier, len(exact)),
+                (func.lower(User.student_id) == identifier, len(exact) + 1),
+            ]
+
+        # Names are tried in query order, skipping words that don't start any stored name word
+        names = potential_names
+        if names:
+            known_prefixes = self._get_name_prefixes(db)
+            names = [name for name in names if name.split()[0] in known_prefixes]
+        if names:
+            logger.debug("Found potential names %s in query.", names)
+        # Per name, an exact match is tried first, then a prefix match, then a match at
+        # the start of a later word (names are stored surname first). Mid-word substrings
+        # such as "John" inside "Johnson" are not treated as matches. Each stage only runs
+        # when the previous one found nobody: exact and prefix matches are index lookups
+        # on LOWER(name) (the prefix as a range, which unlike LIKE can use the index),
+        # while the word-start LIKE has a leading wildcard and scans the table.
+        lowered_name = func.lower(User.name)
+        exact += [(lowered_name == name, rank) for rank, name in enumerate(names, start=len(exact))]
+        prefix = [
+            (and_(lowered_name >= name, lowered_name < _prefix_upper_bound(name)), rank)
+            for rank, name in enumerate(names)
+        ]
+        word_start = [(lowered_name.like(f"% {name}%"), rank) for rank, name in enumerate(names)]
+
+        if not exact:
+            return None
+
+        if any(match.lastgroup == 'attendance' for match in _INTENT_RE.finditer(query)):
+            lookup = db.query(User).options(joinedload(User.attendance))
+        else:
+            # The other answers only need these columns; any other attribute still
+            # loads on access, since this is a regular User entity
+            lookup = db.query(User).options(load_only(User.id, User.name, User.exam_no, User.student_id))
+
+        for candidates in (exact, prefix, word_start):
+            if not candidates:
+                continue
+            user = (
+                lookup
+                .filter(or_(*(condition for condition, _ in candidates)))
+                .order_by(case(*candidates, else_=len(candidates)), User.id)
+                .first()
+            )
+            if user is not None:
+                return user
         return None
     
     def _find_timetable_entry(self, query: str) -> Optional[str]:
@@ -62,8 +195,7 @@ class QueryService:
         Extracts day and time from the query and performs a RAG search
         to find the corresponding timetable entry.
         """
-        time_pattern = r'(?i)(monday|tuesday|wednesday|thursday|friday|saturday|sunday)\s+(?:at)?\s*(\d{1,2}(?::\d{2})?)\s*(?:am|pm)?'
-        match = re.search(time_pattern, query)
+        match = _TIME_RE.search(query)
 
         if not match:
             return None # No time/day pattern found in the query
@@ -71,41 +203,36 @@ class QueryService:
         query_day = match.group(1).capitalize()
         query_time_str = match.group(2)
         
-        print(f"DEBUG: Detected day: {query_day}, Detected time: {query_time_str}")
+        logger.debug("Detected day: %s, Detected time: %s", query_day, query_time_str)
 
         try:
-            if 'am' in query.lower() or 'pm' in query.lower():
-                query_time_obj = datetime.strptime(query_time_str + re.search(r'(am|pm)', query, re.I).group(1), '%I:%M%p').time()
-            else:
-                query_time_obj = datetime.strptime(query_time_str, '%H:%M').time()
+            query_time_obj = _parse_clock(query_time_str, match.group(3))
         except ValueError:
             return "I couldn't understand the time format. Please try '9:00 AM' or '09:00'."
 
         # Create a semantic query for the retriever
         rag_query = f"Timetable for {query_day} at {query_time_str}"
         
-        # --- FIX: Access the retriever correctly from your RAG chain ---
-        # The retriever should be a part of your RAG chain setup in rag_service.py
-        # If your rag_chain is a simple sequence, you may need to load the vector store and retriever here.
+        # Only the retrieved documents are needed here, so skip the LLM entirely
+        retriever = get_retriever()
+        if retriever is None:
+            return "I am unable to access my timetable knowledge base at the moment."
         
         try:
-            from app.services.rag_service import get_retriever
-            relevant_docs = self.rag_chain.invoke(rag_query)
-        except ImportError:
-            # Fallback if get_retriever is not available
-            return "I am unable to access my timetable knowledge base at the moment."
+            relevant_docs = retriever.invoke(rag_query)
         except Exception as e:
-            print(f"An error occurred during retriever search: {e}")
+            logger.error("An error occurred during retriever search: %s", e)
             return "I encountered an error searching the timetable. Please try again."
 
         for doc in relevant_docs:
-            doc_match = re.search(r'For\s(.*?),\s+during\sthe\s(.*?)\sTO\s(.*?)\sslot', doc)
+            doc = doc.page_content
+            doc_match = _DOC_RE.search(doc)
             if doc_match and doc_match.group(1).strip() == query_day:
                 doc_start_time_str, doc_finish_time_str = doc_match.group(2), doc_match.group(3)
                 
                 try:
-                    doc_start_time_obj = datetime.strptime(doc_start_time_str, '%I:%M').time()
-                    doc_finish_time_obj = datetime.strptime(doc_finish_time_str, '%I:%M').time()
+                    doc_start_time_obj = _parse_clock(doc_start_time_str)
+                    doc_finish_time_obj = _parse_clock(doc_finish_time_str)
                     
                     if doc_start_time_obj <= query_time_obj < doc_finish_time_obj:
                         return doc
@@ -114,69 +241,160 @@ class QueryService:
 
         return f"No timetable information found for {query_day} at {query_time_str}."
     
-    def handle_query(self, query: str, db: Session, role: str = "guest") -> str:
+    def _plan_query(self, query: str, db: Session) -> tuple[Optional[str], Optional[str], Optional[str]]:
+        """Runs the student and timetable lookups one after the other, then plans the answer."""
+        user = self._find_user_from_query(query, db)
+        timetable_response = self._find_timetable_entry(query)
+        return self._plan_answer(query, user, timetable_response)
+
+    async def _aplan_query(self, query: str, db: Session) -> tuple[Optional[str], Optional[str], Optional[str]]:
+        """
+        Runs the student lookup (database) and the timetable lookup (vector search)
+        concurrently in the threadpool, then plans the answer.
+        """
+        user, timetable_response = await asyncio.gather(
+            run_in_threadpool(self._find_user_from_query, query, db),
+            run_in_threadpool(self._find_timetable_entry, query)
+        )
+        return self._plan_answer(query, user, timetable_response)
+
+    def _plan_answer(self, query: str, user: Optional[User], timetable_response: Optional[str]) -> tuple[Optional[str], Optional[str], Optional[str]]:
         """
-        Processes a user's query using a hybrid strategy:
+        Decides how to answer a query from the lookup results, using a hybrid strategy:
         1. Identify if the query is about a specific student.
         2. If so, answer specific questions (like attendance) from the DB.
         3. For other questions about the student (like batch), use the RAG service.
         4. If no student is mentioned, use the RAG service for a general answer.
-        """
-        query_lower = query.lower()
-        user = self._find_user_from_query(query, db)
 
-        # Check for timetable-specific queries first
-        timetable_response = self._find_timetable_entry(query)
+        Returns (answer, rag_query, error_message): either a final answer, or the
+        query to send to the RAG chain plus the message to return if that fails.
+        """
+        # Timetable-specific queries take priority
         if timetable_response:
-            return timetable_response
+            return timetable_response, None, None
         
         # --- Scenario 1: A specific student was identified ---
         if user:
-            print(f"DEBUG: Identified user '{user.name}' (Exam No: {user.exam_no}). Analyzing intent...")
+            logger.debug("Identified user '%s' (Exam No: %s). Analyzing intent...", user.name, user.exam_no)
             
-            # Check for questions that can be answered directly from the database
-            if 'attendance' in query_lower:
+            # Check for questions that can be answered directly from the database.
+            # Collect every intent in one scan, then answer in priority order.
+            intents = {match.lastgroup for match in _INTENT_RE.finditer(query)}
+            if 'attendance' in intents:
                 if not user.attendance:
-                    return f"I couldn't find any attendance records for {user.name}."
+                    return f"I couldn't find any attendance records for {user.name}.", None, None
                 attendance_list = "\n".join([f"- {att.subject}: {att.percentage}%" for att in user.attendance])
-                return f"Certainly! Here is the attendance for {user.name}:\n{attendance_list}"
+                return f"Certainly! Here is the attendance for {user.name}:\n{attendance_list}", None, None
 
-            if 'student id' in query_lower:
-                return f"The student ID for {user.name} is {user.student_id}." if user.student_id else f"I don't have a Student ID on file for {user.name}."
+            if 'student_id' in intents:
+                answer = f"The student ID for {user.name} is {user.student_id}." if user.student_id else f"I don't have a Student ID on file for {user.name}."
+                return answer, None, None
 
-            if 'exam no' in query_lower or 'exam number' in query_lower:
-                return f"The exam number for {user.name} is {user.exam_no}."
+            if 'exam_no' in intents:
+                return f"The exam number for {user.name} is {user.exam_no}.", None, None
 
             # If the question is not about DB data, use the RAG service with the student's info.
-            print(f"DEBUG: Query about '{user.name}' requires RAG lookup. Rephrasing query.")
+            logger.debug("Query about '%s' requires RAG lookup. Rephrasing query.", user.name)
             
             rag_query = f"Based on the provided documents, answer this question about the student with exam number {user.exam_no}: {query}"
             
             if not self.rag_chain:
-                return "I can access student records, but my broader knowledge base is unavailable right now."
+                return "I can access student records, but my broader knowledge base is unavailable right now.", None, None
             
-            try:
-                response = self.rag_chain.invoke(rag_query)
-                return response.strip()
-            except Exception as e:
-                print(f"An error occurred while invoking the RAG chain for a user-specific query: {e}")
-                return "I found the student, but had trouble looking up the details. Please try again."
+            return None, rag_query, "I found the student, but had trouble looking up the details. Please try again."
 
         # --- Scenario 2: No student identified, perform a general RAG search ---
-        print("DEBUG: No specific user identified. Using RAG for a general answer.")
+        logger.debug("No specific user identified. Using RAG for a general answer.")
         if not self.rag_chain:
-            return "I'm sorry, my knowledge base is currently unavailable. Please try again later."
+            return "I'm sorry, my knowledge base is currently unavailable. Please try again later.", None, None
         
+        return None, query, "I encountered an error while processing your request. Please try again."
+
+    def handle_query(self, query: str, db: Session, role: str = "guest") -> str:
+        """Processes a user's query, blocking on the RAG chain if it is needed."""
+        answer, rag_query, error_message = self._plan_query(query, db)
+        if rag_query is None:
+            return answer
+
+        try:
+            return self._invoke_rag(rag_query, role)
+        except Exception as e:
+            logger.error("An error occurred while invoking the RAG chain: %s", e)
+            return error_message
+
+    async def ahandle_query(self, query: str, db: Session, role: str = "guest") -> str:
+        """
+        Async version of handle_query. The database lookups run in the threadpool and
+        the network-bound RAG call is awaited, so it doesn't hold a worker thread.
+        """
+        answer, rag_query, error_message = await self._aplan_query(query, db)
+        if rag_query is None:
+            return answer
+
+        normalized_query = " ".join(rag_query.split())
+        key = self.rag_cache.make_key(normalized_query, role)
         try:
-            response = self.rag_chain.invoke(query)
-            return response.strip()
+            return await self.rag_cache.aget_or_compute(key, lambda: self._ainvoke_chain(normalized_query))
         except Exception as e:
-            print(f"An error occurred while invoking the RAG chain: {e}")
-            return "I encountered an error while processing your request. Please try again."
+            logger.error("An error occurred while invoking the RAG chain: %s", e)
+            return error_message
+
+    async def _ainvoke_chain(self, rag_query: str) -> str:
+        """Awaits the RAG chain for an already-normalized query."""
+        return (await self.rag_chain.ainvoke(rag_query)).strip()
+
+    async def astream_query(self, query: str, db: Session, role: str = "guest") -> AsyncIterator[str]:
+        """
+        Processes a query and returns an async iterator over the answer text. The
+        database work happens before this returns; RAG answers are then streamed
+        token by token as the LLM generates them (or replayed whole from the cache).
+        """
+        answer, rag_query, error_message = await self._aplan_query(query, db)
+        if rag_query is None:
+            return _iter_once(answer)
+
+        normalized_query = " ".join(rag_query.split())
+        key = self.rag_cache.make_key(normalized_query, role)
+        cached = self.rag_cache.get(key)
+        if cached is not None:
+            return _iter_once(cached)
+        return self._astream_rag(normalized_query, key, error_message)
+
+    async def _astream_rag(self, rag_query: str, key: str, error_message: str) -> AsyncIterator[str]:
+        """Streams RAG output, caching the full answer once generation completes."""
+        parts = []
+        try:
+            async for chunk in self.rag_chain.astream(rag_query):
+                parts.append(chunk)
+                yield chunk
+        except Exception as e:
+            logger.error("An error occurred while streaming the RAG chain: %s", e)
+            if not parts:
+                yield error_message
+            return
+        self.rag_cache.set(key, "".join(parts).strip())
+
+async def _iter_once(text: str) -> AsyncIterator[str]:
+    """Wraps a ready answer as a single-chunk stream."""
+    yield text
 
 # --- Integration with your FastAPI Endpoints ---
-query_service_instance = QueryService()
+@lru_cache(maxsize=1)
+def get_query_service() -> QueryService:
+    """
+    Returns the process-wide QueryService, creating it (and loading the RAG chain)
+    on first use. The API warms it at startup, so importing this module stays cheap.
+    """
+    return QueryService()
 
 def handle_query_logic(query: str, role: str, db: Session):
     """Entry point for the FastAPI endpoint."""
-    return query_service_instance.handle_query(query, db, role)
\ No newline at end of file
+    return get_query_service().handle_query(query, db, role)
+
+async def ahandle_query_logic(query: str, role: str, db: Session) -> str:
+    """Async entry point for the FastAPI endpoint."""
+    return await get_query_service().ahandle_query(query, db, role)
+
+async def astream_query_logic(query: str, role: str, db: Session) -> AsyncIterator[str]:
+    """Entry point for the streaming FastAPI endpoint."""
+    return await get_query_service().astream_query(query, db, role)
@@ -0,0 +1,91 @@
+"""
+An in-process cache for RAG answers, so repeated questions skip the retrieval
+and LLM round-trip.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+class SmartRAGCache:
+    """
+    A thread-safe LRU cache with a per-entry time-to-live.
+
+    Keys combine the normalized query, the caller's role and a version string
+    describing the RAG configuration, so changing the embedding model, retriever
+    or LLM invalidates every earlier answer.
+    """
+    def __init__(self, config_version: str, max_items: int = 1024, ttl: float = 600.0):
+        self.config_version = config_version
+        self.max_items = max_items
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Lowercases and collapses whitespace so trivially different queries share an entry."""
+        return " ".join(query.lower().split())
+
+    def make_key(self, query: str, role: str) -> str:
+        """Builds the cache key for a query asked under a given role."""
+        raw = "\x1f".join((self.config_version, role, self.normalize(query)))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """Returns the cached value for `key`, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value) -> None:
+        """Stores `value`, evicting the least recently used entry when full."""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key: str, compute: Callable[[], str]) -> str:
+        """
+        Returns the cached value for `key`, calling `compute` on a miss. The lock is
+        not held while computing; errors propagate and are therefore not cached.
+        """
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    async def aget_or_compute(self, key: str, compute: Callable[[], Awaitable[str]]) -> str:
+        """Async version of get_or_compute, for callers that await the RAG chain."""
+        value = self.get(key)
+        if value is None:
+            value = await compute()
+            self.set(key, value)
+        return value
+
+    def stats(self) -> dict:
+        """Returns the hit/miss counters and the current number of entries."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+    def clear(self) -> None:
+        """Drops every entry and resets the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
@@ -2,39 +2,186 @@
 Handles the Retrieval-Augmented Generation (RAG) pipeline.
 """
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
 from langchain_huggingface import HuggingFaceEmbeddings # <<< LATEST LIBRARY
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import PromptTemplate
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.embeddings import Embeddings
 from app.core.config import settings
+import faiss
+import functools
+import json
 import os
+import numpy as np
+import torch
 
 DB_FAISS_PATH = 'vectorstore/'
+# Written by scripts/ingest.py: the raw FAISS index, and one JSON document per line
+# whose line number is the document's position in the index
+INDEX_PATH = os.path.join(DB_FAISS_PATH, 'index.faiss')
+DOCSTORE_PATH = os.path.join(DB_FAISS_PATH, 'docs.jsonl')
 EMBEDDING_MODEL = 'BAAI/bge-large-en-v1.5'
+EMBEDDING_DEVICE = 'cuda' if torch.cuda.is_available() else 'cpu'
+# Documents are embedded in batches of this size during ingestion
+EMBEDDING_BATCH_SIZE = 64
+# Optional: INT8 ONNX build of the embedding model (see scripts/quantize_embeddings.py)
+EMBEDDING_ONNX_PATH = 'models/bge-int8'
+# Fewer retrieved chunks means a much shorter prompt for the LLM to prefill
+RETRIEVER_K = 8
+# HNSW search breadth: higher is more accurate but slower
+HNSW_EF_SEARCH = 64
+LLM_MODEL = "gemini-2.5-pro"
+# Identifies the RAG configuration; cached answers are keyed on it
+RAG_CONFIG_VERSION = f"{EMBEDDING_MODEL}|k={RETRIEVER_K}|{LLM_MODEL}"
+QUERY_EMBEDDING_CACHE_SIZE = 4096
 
-def get_rag_chain():
+class ONNXEmbeddings(Embeddings):
     """
-    Builds and returns the RAG chain. Returns None if the vector store doesn't exist.
+    Embeds text with the INT8 ONNX build of the BGE model. Produces the same
+    normalized CLS embeddings as HuggingFaceEmbeddings, at about half the CPU cost.
     """
-    if not os.path.exists(DB_FAISS_PATH):
-        print(f"Error: Vector store not found at '{DB_FAISS_PATH}'. Please run the ingestion script.")
-        return None
+    def __init__(self, model_path: str, batch_size: int = 64):
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            model_path, file_name="model_quantized.onnx", provider="CPUExecutionProvider"
+        )
+        self.batch_size = batch_size
+
+    def _embed(self, texts: list[str]) -> list[list[float]]:
+        """Embeds one batch of texts (CLS pooling, L2-normalized)."""
+        inputs = self.tokenizer(texts, padding=True, truncation=True, max_length=512, return_tensors="pt")
+        with torch.inference_mode():
+            cls = self.model(**inputs).last_hidden_state[:, 0]
+        return torch.nn.functional.normalize(cls, dim=-1).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embeds texts in batches of `batch_size`."""
+        embedded = []
+        for start in range(0, len(texts), self.batch_size):
+            embedded.extend(self._embed(texts[start:start + self.batch_size]))
+        return embedded
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embeds a single query."""
+        return self._embed([text])[0]
+
+@functools.lru_cache(maxsize=1)
+def load_embeddings() -> Embeddings:
+    """
+    Returns the embedding model: the INT8 ONNX build when it exists and embeddings
+    run on the CPU, otherwise the regular HuggingFace model. The model is loaded
+    once per process and shared by every caller.
+    """
+    if EMBEDDING_DEVICE == 'cpu' and os.path.exists(EMBEDDING_ONNX_PATH):
+        try:
+            embeddings = ONNXEmbeddings(EMBEDDING_ONNX_PATH, batch_size=EMBEDDING_BATCH_SIZE)
+            print("INT8 ONNX embedding model loaded successfully.")
+            return embeddings
+        except Exception as e:
+            print(f"Error loading ONNX embedding model, falling back to PyTorch: {e}")
 
-    embeddings = HuggingFaceEmbeddings(
+    # Also used by scripts/ingest.py to build the index. Normalized embeddings make
+    # L2 ranking equivalent to cosine similarity (recommended for BGE).
+    return HuggingFaceEmbeddings(
         model_name=EMBEDDING_MODEL,
-        model_kwargs={'device': 'cpu'}
+        model_kwargs={'device': EMBEDDING_DEVICE},
+        encode_kwargs={'batch_size': EMBEDDING_BATCH_SIZE, 'normalize_embeddings': True}
     )
-    
-    db = FAISS.load_local(
-        DB_FAISS_PATH, 
-        embeddings, 
-        allow_dangerous_deserialization=True
+
+def load_vector_store(embeddings) -> FAISS:
+    """
+    Loads the FAISS store saved by scripts/ingest.py. The HNSW graph and its FP16
+    codes are read into process memory (FAISS can only memory-map flat and
+    inverted-list storage), so each worker process holds its own copy.
+    """
+    index = faiss.read_index(INDEX_PATH)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    with open(DOCSTORE_PATH, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    docstore = InMemoryDocstore({
+        str(record["id"]): Document(page_content=record["content"], metadata=record["metadata"])
+        for record in records
+    })
+    index_to_docstore_id = {record["id"]: str(record["id"]) for record in records}
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id
     )
+
+def make_cached_retriever(db: FAISS, embeddings) -> RunnableLambda:
+    """
+    Returns a retriever that memoizes query text -> embedding. Embedding a query with
+    the large BGE model on CPU is the biggest fixed cost per lookup, while the HNSW
+    search itself is cheap, so repeated questions skip straight to the search.
+    """
+    @functools.lru_cache(maxsize=QUERY_EMBEDDING_CACHE_SIZE)
+    def embed_query(query: str) -> np.ndarray:
+        vector = np.asarray(embeddings.embed_query(query), dtype=np.float32)
+        vector.flags.writeable = False
+        return vector
+
+    def retrieve(query: str):
+        _, positions = db.index.search(embed_query(query).reshape(1, -1), RETRIEVER_K)
+        # FAISS pads with -1 when the index holds fewer than k vectors
+        return [db.docstore.search(db.index_to_docstore_id[int(i)]) for i in positions[0] if i != -1]
+
+    return RunnableLambda(retrieve)
+
+def vector_store_ready() -> bool:
+    """
+    Returns True if the vector store files exist. The files themselves are checked:
+    an interrupted ingest can leave the directory (with only the embedding cache in
+    it), and stores from before the JSONL docstore were built with unnormalized
+    vectors that today's query embeddings can't rank against.
+    """
+    if os.path.exists(INDEX_PATH) and os.path.exists(DOCSTORE_PATH):
+        return True
+    print(f"Error: Vector store not found at '{DB_FAISS_PATH}'. Please run the ingestion script.")
+    return False
+
+def get_retriever():
+    """
+    Returns the document retriever on its own, for lookups that don't need the LLM,
+    or None if the vector store doesn't exist yet. Only a successful build is cached,
+    so a store created after startup is picked up on the next call.
+    """
+    if _build_retriever.cache_info().currsize == 0 and not vector_store_ready():
+        return None
+    return _build_retriever()
+
+@functools.lru_cache(maxsize=1)
+def _build_retriever():
+    """Loads the vector store and builds the retriever, once per process."""
+    embeddings = load_embeddings()
+    
+    db = load_vector_store(embeddings)
     
-    retriever = db.as_retriever(search_kwargs={'k': 35})
+    return make_cached_retriever(db, embeddings)
+
+def get_rag_chain():
+    """
+    Returns the RAG chain, or None if the vector store doesn't exist yet. The chain
+    is built once per process and reused by every caller; like the retriever, a
+    missing store is not cached.
+    """
+    if get_retriever() is None:
+        return None
+    return _build_rag_chain()
+
+@functools.lru_cache(maxsize=1)
+def _build_rag_chain():
+    """Builds the RAG chain on top of the shared retriever."""
+    retriever = _build_retriever()
 
-    llm = ChatGoogleGenerativeAI(model="gemini-2.5-pro", google_api_key=settings.GOOGLE_API_KEY)
+    llm = ChatGoogleGenerativeAI(model=LLM_MODEL, google_api_key=settings.GOOGLE_API_KEY)
 
     prompt_template = """
     You are a helpful college assistant. Based ONLY on the provided context, please answer the user's question accurately.
@@ -0,0 +1,24 @@
+"""
+Gunicorn settings for serving SpeechToSpeech.py with several worker processes.
+
+Run with `gunicorn SpeechToSpeech:app` from the project root. On CPU hosts the app
+(and with it the STT/TTS models) is loaded once in the master process and the workers
+are forked from it, so they share the model weights instead of each loading their own
+copy. On GPU hosts each worker loads the app itself after the fork, because a CUDA
+context created in the master cannot be used in a forked child.
+"""
+import os
+
+# Ask torch to detect GPUs through NVML, which does not initialise CUDA in the master
+os.environ.setdefault("PYTORCH_NVML_BASED_CUDA_CHECK", "1")
+import torch
+
+bind = "127.0.0.1:5001"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("SPEECH_WORKERS", "2"))
+
+# Load the models before forking so every worker shares the same weight pages (CPU only)
+preload_app = not torch.cuda.is_available()
+
+# The first request per worker can be slow while torch.compile traces the models
+timeout = 300
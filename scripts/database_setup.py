@@ -8,8 +8,9 @@ identifiers, and populates a SQL database.
 import sys
 import os
 import re
-import random
+from operator import itemgetter
 import fitz
+import numpy as np
 
 # Add the project root to the Python path to allow for absolute imports
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -18,17 +19,20 @@ from app.db.database import engine, Base, SessionLocal
 from app.db.models import User, Attendance
 
 PDF_FILE_PATH = "data/7_Roll Numbers.pdf"
+SUBJECTS = ("Physics", "Chemistry", "Mathematics", "Data Structures", "Algorithms")
 
-def extract_student_info(raw_string):
+# Compiled once at import rather than on every call
+# Exam number, then student ID (or the start of the name), then the name in capitals
+_STUDENT_RECORD_RE = re.compile(r'(IT\d{3})[",\s]+?([0-9A-Z]+)\s+([A-Z\s]+)(?=\s*IT\d{3}|$)')
+
+def iter_clean_pages(doc):
     """
-    Extracts the student ID and clean name from the raw text.
-    (This function is unchanged as its logic is sound.)
+    Yields the text of each page with its header lines removed and its lines joined
+    by spaces, so records are matched one page at a time instead of on one
+    whole-document string.
     """
-    raw_string = raw_string.strip().strip('"')
-    parts = raw_string.split(' ', 1)
-    if len(parts) == 2 and re.match(r'^[A-Z0-9]+$', parts[0]):
-        return {'student_id': parts[0], 'name': parts[1].strip()}
-    return {'student_id': "Not Available", 'name': raw_string.strip()}
+    for page in doc:
+        yield " ".join(line for line in page.get_text().split('\n') if "Exam No." not in line)
 
 def parse_students_from_pdf(file_path: str):
     """
@@ -42,44 +46,47 @@ def parse_students_from_pdf(file_path: str):
     print(f"Loading and parsing PDF from '{file_path}'...")
     students = []
     try:
-        doc = fitz.open(file_path)
-        
-        # 1. PREPROCESSING STEP: Clean the text by removing page headers
-        cleaned_text = ""
-        for page in doc:
-            page_text = page.get_text()
-            lines = page_text.split('\n')
-            # Filter out the header line from each page
-            cleaned_lines = [line for line in lines if "Exam No." not in line]
-            cleaned_text += "\n".join(cleaned_lines)
-
-        # 2. PARSING STEP: Use a robust regex on the cleaned text
-        pattern = re.compile(r'(IT\d{3})[",\s]+?([0-9A-Z]+)\s+([A-Z\s]+)(?=\s*IT\d{3}|$)')
-        matches = pattern.findall(cleaned_text.replace('\n', ' '))
-        
-        for exam_no, student_id, name in matches:
-            # Handle cases where the student ID is part of the name field
-            if "ITU" in student_id or "ECU" in student_id:
-                students.append({
-                    "exam_no": exam_no.strip(), 
-                    "student_id": student_id.strip(), 
-                    "name": name.strip().replace("  ", " ")
-                })
-            else:
-                # If the second part isn't a student ID, it's part of the name
-                new_name = f"{student_id} {name}".strip()
-                students.append({
-                    "exam_no": exam_no.strip(), 
-                    "student_id": "Not Available", 
-                    "name": new_name.replace("  ", " ")
-                })
+        seen_exam_nos = set()
+        with fitz.open(file_path) as doc:
+            # 1. PREPROCESSING STEP: Clean each page by removing its header
+            # 2. PARSING STEP: Use a robust regex on each cleaned page
+            for page_text in iter_clean_pages(doc):
+                for match in _STUDENT_RECORD_RE.finditer(page_text):
+                    # The exam number and student ID groups cannot contain whitespace,
+                    # so only the name needs stripping
+                    exam_no, student_id, name = match.groups()
+                    # Keep the first record per exam number (exam_no is unique in the database)
+                    if exam_no in seen_exam_nos:
+                        continue
+                    seen_exam_nos.add(exam_no)
+                    # Exam numbers are always IT followed by digits; parse the number once
+                    exam_no_num = int(exam_no[2:])
+
+                    # Handle cases where the student ID is part of the name field
+                    if "ITU" in student_id or "ECU" in student_id:
+                        students.append({
+                            "exam_no": exam_no,
+                            "exam_no_num": exam_no_num,
+                            "student_id": student_id,
+                            "name": name.strip().replace("  ", " ")
+                        })
+                    else:
+                        # If the second part isn't a student ID, it's part of the name
+                        new_name = f"{student_id} {name}".strip()
+                        students.append({
+                            "exam_no": exam_no,
+                            "exam_no_num": exam_no_num,
+                            "student_id": "Not Available", 
+                            "name": new_name.replace("  ", " ")
+                        })
 
         if not students:
             print("Could not parse any student records.")
             return []
 
         print(f"Successfully parsed {len(students)} student records from the PDF.")
-        return sorted(students, key=lambda x: int(x['exam_no'].replace("IT", "")))
+        students.sort(key=itemgetter("exam_no_num"))
+        return students
 
     except Exception as e:
         print(f"An error occurred while parsing student data: {e}")
@@ -93,10 +100,15 @@ def setup_sql_database():
     """
     print("Setting up SQL database...")
     Base.metadata.create_all(bind=engine)
+    # create_all skips tables that already exist, so add any indexes they are missing
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
     
     db = SessionLocal()
     try:
-        if db.query(User).count() > 0:
+        # EXISTS stops at the first row instead of counting the whole table
+        if db.query(db.query(User.id).exists()).scalar():
             print("Database already contains data. Skipping population.")
             return
 
@@ -106,27 +118,34 @@ def setup_sql_database():
             return
 
         print(f"Database is empty. Populating with parsed student data...")
-        for student in student_data:
-            user_id = int(re.search(r'\d+', student["exam_no"]).group())
-            
-            student_user = User(
-                id=user_id,
-                name=student["name"],
-                exam_no=student["exam_no"],
-                student_id=student["student_id"],
-                role="student"
-            )
-            db.add(student_user)
-            db.flush()
-
-            subjects = ["Physics", "Chemistry", "Mathematics", "Data Structures", "Algorithms"]
-            for subject in subjects:
-                db.add(Attendance(
-                    subject=subject,
-                    percentage=round(random.uniform(65.0, 99.5), 2),
-                    user_id=student_user.id
-                ))
-
+        # Build plain row dicts and insert each table in one batched statement;
+        # user ids come from the exam number, so no flush is needed to learn them.
+        users = [
+            {
+                "id": student["exam_no_num"],
+                "name": student["name"],
+                "exam_no": student["exam_no"],
+                "student_id": student["student_id"],
+                "role": "student"
+            }
+            for student in student_data
+        ]
+        # Draw every attendance percentage in one vectorized call
+        rng = np.random.default_rng()
+        percentages = rng.uniform(65.0, 99.5, size=(len(users), len(SUBJECTS))).round(2).tolist()
+        attendances = [
+            {
+                "subject": subject,
+                "percentage": percentages[i][j],
+                "user_id": user["id"]
+            }
+            for i, user in enumerate(users)
+            for j, subject in enumerate(SUBJECTS)
+        ]
+        # Core table inserts run as a single executemany per table, skipping the
+        # per-row ORM mapping work that bulk_insert_mappings still does
+        db.execute(User.__table__.insert(), users)
+        db.execute(Attendance.__table__.insert(), attendances)
         db.commit()
         print(f"Database populated successfully with {len(student_data)} students.")
 
@@ -1,44 +1,113 @@
 import os
 import re
+import hashlib
+import json
 import sys
+import faiss
 import fitz
+import numpy as np
 import pandas as pd
-from langchain_community.document_loaders import PyMuPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
 from langchain.docstore.document import Document
+from transformers import AutoTokenizer
 from typing import List, Dict, Tuple, Optional
 from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from bisect import bisect_right
+from operator import itemgetter
 
 
 # Ensure the app module can be found
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from app.core.config import settings
+from app.services.rag_service import load_embeddings, EMBEDDING_MODEL, INDEX_PATH, DOCSTORE_PATH
 
 # --- Configuration ---
 DATA_PATH = "data/"
 DB_FAISS_PATH = "vectorstore/"
-EMBEDDING_MODEL = 'BAAI/bge-large-en-v1.5'
+# Vectors keyed by the SHA-256 of each document's text, so unchanged documents are
+# not re-embedded (and a failed index build resumes without re-embedding anything)
+EMBEDDING_CACHE_PATH = os.path.join(DB_FAISS_PATH, "emb_cache.npz")
+# HNSW graph settings: neighbours per node and build-time search breadth
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+# Storage format of the indexed vectors: QT_fp16 halves memory with no training;
+# QT_8bit quarters it and is trained on the corpus's own vectors
+VECTOR_QUANTIZER = faiss.ScalarQuantizer.QT_fp16
+# Documents are embedded and indexed this many at a time to bound peak memory
+INGEST_CHUNK_SIZE = 256
+# Large PDFs are split into blocks of pages that are parsed in separate processes
+PAGE_BLOCK_SIZE = 8
+PARALLEL_EXTRACTION_MIN_PAGES = 4
+# Every student profile document shares this metadata; it is never modified downstream
+STUDENT_PROFILE_METADATA = {"source": "Multiple Files", "record_type": "student_profile"}
+# Syllabus chunks are sized in embedding-model tokens; chunks under the minimum are
+# merged into their neighbour on the same page while the result stays within the cap
+SYLLABUS_CHUNK_TOKENS = 350
+SYLLABUS_CHUNK_OVERLAP_TOKENS = 40
+SYLLABUS_MIN_CHUNK_TOKENS = 100
+SYLLABUS_MAX_MERGED_TOKENS = 400
+
+# --- Parsing Patterns (compiled once at import) ---
+# Exam number, then student ID (or the start of the name), then the name in capitals
+STUDENT_RECORD_RE = re.compile(r'(IT\d{3})[",\s]+?([0-9A-Z]+)\s+([A-Z\s]+)(?=\s*IT\d{3}|$)')
+BATCH_ALLOCATION_RE = re.compile(r'([EF]\d)\s+(\d+)\s+(\d+)\s+([A-Z]+)')
+TIME_COLUMN_RE = re.compile(r'\d{1,2}:\d{2}')
+# A timetable cell holds lab sessions ("E1-SUBJ-Faculty Location") and/or lectures ("SUBJ\nFACULTY")
+LAB_PATTERN = r'([A-Z]\d)-([A-Z]+(?:-[A-Z]+)?)-([a-zA-Z]+)\s(.*)'
+LECTURE_PATTERN = r'([A-Z]+)\n([A-Z]+)'
+# re.M flag allows ^ and $ to match at the start/end of a line
+TIMETABLE_CELL_RE = re.compile(f'{LAB_PATTERN}|{LECTURE_PATTERN}', re.M)
 
 # --- Helper Functions ---
+def extract_student_matches(page_range: Tuple[str, int, int]) -> List[Tuple[str, str, str]]:
+    """
+    Matches student records on pages [start, end) of a PDF. Takes a single tuple
+    so it can be mapped over page blocks in worker processes.
+    """
+    file_path, start, end = page_range
+    # Match records page by page instead of on one whole-document string
+    with fitz.open(file_path) as doc:
+        return [
+            match.groups()
+            for page_number in range(start, end)
+            for match in STUDENT_RECORD_RE.finditer(doc[page_number].get_text().replace('\n', ' '))
+        ]
+
 def load_student_data(file_path: str) -> List[Dict]:
     """Parses the student roll numbers PDF."""
     print(f"Loading student data from: {file_path}")
     students = []
     try:
-        doc = fitz.open(file_path)
-        text = "".join([page.get_text() for page in doc])
-        pattern = re.compile(r'(IT\d{3})[",\s]+?([0-9A-Z]+)\s+([A-Z\s]+)(?=\s*IT\d{3}|$)')
-        matches = pattern.findall(text.replace('\n', ' '))
+        with fitz.open(file_path) as doc:
+            page_count = doc.page_count
+        if page_count < PARALLEL_EXTRACTION_MIN_PAGES:
+            matches = extract_student_matches((file_path, 0, page_count))
+        else:
+            # Text extraction is CPU-bound, so spread blocks of pages over processes;
+            # map returns the blocks in page order
+            blocks = [
+                (file_path, start, min(start + PAGE_BLOCK_SIZE, page_count))
+                for start in range(0, page_count, PAGE_BLOCK_SIZE)
+            ]
+            with ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, len(blocks))) as executor:
+                matches = [match for block in executor.map(extract_student_matches, blocks) for match in block]
+        # Keep the first record per exam number so each student gets one profile document
+        seen_exam_nos = set()
         for exam_no, student_id, name in matches:
+            if exam_no in seen_exam_nos:
+                continue
+            seen_exam_nos.add(exam_no)
+            # The numeric part of the exam number, parsed once and used as the sort key
+            exam_no_num = int(exam_no[2:])
             if "ITU" in student_id or "ECU" in student_id:
-                students.append({"exam_no": exam_no.strip(), "student_id": student_id.strip(), "name": name.strip().replace("  ", " ")})
+                students.append({"exam_no": exam_no, "exam_no_num": exam_no_num, "student_id": student_id, "name": name.strip().replace("  ", " ")})
             else:
                 new_name = f"{student_id} {name}".strip()
-                students.append({"exam_no": exam_no.strip(), "student_id": "Not Available", "name": new_name.replace("  ", " ")})
+                students.append({"exam_no": exam_no, "exam_no_num": exam_no_num, "student_id": "Not Available", "name": new_name.replace("  ", " ")})
         print(f"Successfully loaded {len(students)} student records.")
-        return sorted(students, key=lambda x: int(x['exam_no'].replace("IT", "")))
+        students.sort(key=itemgetter("exam_no_num"))
+        return students
     except Exception as e:
         print(f"An error occurred while parsing student data: {e}")
         return []
@@ -48,11 +117,10 @@ def load_batch_allocations(file_path: str) -> List[Dict]:
     print(f"Loading batch allocations from: {file_path}")
     allocations = []
     try:
-        doc = fitz.open(file_path)
-        text = doc[0].get_text()
-        pattern = re.compile(r'([EF]\d)\s+(\d+)\s+(\d+)\s+([A-Z]+)')
-        matches = pattern.findall(text)
-        for batch, from_id, to_id, counselor in matches:
+        with fitz.open(file_path) as doc:
+            text = doc[0].get_text()
+        for match in BATCH_ALLOCATION_RE.finditer(text):
+            batch, from_id, to_id, counselor = match.groups()
             allocations.append({"batch": batch, "from_id": int(from_id), "to_id": int(to_id), "counselor": counselor})
         print(f"Loaded {len(allocations)} batch allocation records.")
         return allocations
@@ -60,17 +128,32 @@ def load_batch_allocations(file_path: str) -> List[Dict]:
         print(f"Error loading batch allocations: {e}")
         return []
 
-def get_batch_for_student(exam_no: str, allocations: List[Dict]) -> Tuple[Optional[str], Optional[str]]:
-    """Matches a student's exam number to their allocated batch and counselor."""
-    try:
-        student_id_num = int(exam_no.replace("IT", ""))
-        for alloc in allocations:
-            if alloc["from_id"] <= student_id_num <= alloc["to_id"]:
-                return alloc["batch"], alloc["counselor"]
-    except ValueError:
-        return None, None
+def index_batch_allocations(allocations: List[Dict]) -> Tuple[List[Dict], List[int]]:
+    """Sorts the allocations by their first ID and returns them with the list of first IDs."""
+    allocations = sorted(allocations, key=lambda alloc: alloc["from_id"])
+    return allocations, [alloc["from_id"] for alloc in allocations]
+
+def get_batch_for_student(exam_no_num: int, allocations: List[Dict], from_ids: List[int]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Matches a student's exam number (its numeric part, already parsed by
+    load_student_data) to their allocated batch and counselor. `allocations` and
+    `from_ids` come from index_batch_allocations, so the enclosing range is found
+    with a binary search.
+    """
+    i = bisect_right(from_ids, exam_no_num) - 1
+    if i >= 0 and exam_no_num <= allocations[i]["to_id"]:
+        return allocations[i]["batch"], allocations[i]["counselor"]
     return None, None
 
+def format_student_profile(student: Dict, batch: Optional[str], counselor: Optional[str]) -> str:
+    """Builds the text of a student's profile document."""
+    content = (f"Student Profile. Full Name: {student['name']}. "
+               f"Exam Number: {student['exam_no']}. "
+               f"Student ID: {student.get('student_id', 'Not Available')}.")
+    if batch and counselor:
+        content += f" Batch: {batch}. Faculty Counselor: {counselor}."
+    return content
+
 def parse_timetable_from_excel(file_path: str, division: str) -> List[Document]:
     """
     Parses a timetable from an Excel file into a list of Documents.
@@ -79,7 +162,8 @@ def parse_timetable_from_excel(file_path: str, division: str) -> List[Document]:
     print(f"Parsing timetable for Division {division} from Excel: {file_path}")
     documents = []
     try:
-        df = pd.read_excel(file_path, header=6)
+        # The Rust-based calamine reader parses xlsx several times faster than openpyxl
+        df = pd.read_excel(file_path, header=6, engine="calamine")
         
         # --- DEBUGGING: Print the entire DataFrame to see its contents ---
         pd.set_option('display.max_rows', None)
@@ -93,7 +177,7 @@ def parse_timetable_from_excel(file_path: str, division: str) -> List[Document]:
         # print(df.columns);
         # Identify day and time columns
         day_column = "Day" if '' in df.columns else df.columns[1]
-        time_columns = [col for col in df.columns if re.match(r'\d{1,2}:\d{2}', str(col))]
+        time_columns = [col for col in df.columns if TIME_COLUMN_RE.match(str(col))]
         
         print(f"Detected day column: {day_column}")
         print(f"Detected time columns: {time_columns}")
@@ -102,66 +186,73 @@ def parse_timetable_from_excel(file_path: str, division: str) -> List[Document]:
             print("Error: Could not find time columns in the Excel file.")
             return []
             
-        # Define the patterns with capturing groups for the parts you need
-        lab_pattern = r'([A-Z]\d)-([A-Z]+(?:-[A-Z]+)?)-([a-zA-Z]+)\s(.*)'
         # project_lab_pattern = r'([A-Z]\d)-([A-Z]+-[A-Z]+)-([a-zA-Z]+)\s(.*)'
-        lecture_pattern = r'([A-Z]+)\n([A-Z]+)'
         room_row = df[df[day_column] == "ROOM"]
         lecture_room_no = None
         if not room_row.empty:
             # Extract the first non-empty value from the room row (after the day column)
-            for col in room_row.columns[2:]:
-                if pd.notna(room_row.iloc[0][col]):
-                    lecture_room_no = room_row.iloc[0][col]
-                    break
+            room_values = room_row.iloc[0, 2:].dropna()
+            if not room_values.empty:
+                lecture_room_no = room_values.iloc[0]
         print(f"lecture_room_no: {lecture_room_no}")
-        for _, row in df.iterrows():
-            day = row[day_column]
-            if not isinstance(day, str) or not day.strip():
-                # --- DEBUGGING: Show which day is being skipped and why ---
-                print(f"Skipping row with day: {day}")
-                continue
-            for time_col in time_columns:
-                start_time, finish_time = re.split(" TO ", time_col)
-                print(f"Start Time: {start_time}, Finish Time: {finish_time}")
-                
-            
-                cell_content = row[time_col]
-                if pd.notna(cell_content):
-                    # Find all matches of either pattern in the cell content
-                    # re.M flag allows ^ and $ to match at the start/end of a line
-                    print(cell_content)
-                    matches = re.findall(f'{lab_pattern}|{lecture_pattern}', str(cell_content), re.M)
-                    print(matches)
-                    for match in matches:
-                        # Unpack the tuple from findall. It will have empty strings for unmatched groups
-                        lab_batch, lab_subject, lab_faculty, lab_location, lecture_subject, lecture_faculty = match
-                        
-                        if lab_subject:
-                            # It's a lab session
-                            print(f"Detected a lab session: Batch={lab_batch}, Subject={lab_subject}, Faculty={lab_faculty}, Location={lab_location}")
-                            item_content = f"Batch: {lab_batch}, Subject: {lab_subject}, Faculty: {lab_faculty}, Lab Location: {lab_location}"
-                            finish_time_obj = datetime.strptime(finish_time,'%I:%M')
-                            temp_finish_time = finish_time_obj + timedelta(hours=1)
-                            new_finish_time = temp_finish_time.strftime('%H:%M')
-
-
-                        elif lecture_subject:
-                            # It's a lecture session
-                            print(f"Detected a lecture session: Subject={lecture_subject}, Faculty={lecture_faculty}")
-                            item_content = f"Subject: {lecture_subject}, Faculty: {lecture_faculty}, Room No:{lecture_room_no}"
-                            new_finish_time = finish_time
-                        else:
-                            # Handle other content or skip
-                            # The code you provided shows 'Other content: 26'
-                            # You may need a different pattern or a check here
-                            print(f"Other content found and skipped.")
-                            continue
-
-                        content = (f"For {day}, "
-                                   f"during the {start_time} TO {new_finish_time} slot, the schedule is: {item_content}.")
-                        print(content)
-                        documents.append(Document(page_content=content, metadata={"source": os.path.basename(file_path), "record_type": "timetable_entry"}))
+
+        # Resolve each time slot once, rather than once per row: its start and finish
+        # times, and the finish time of a lab starting in it (labs run an extra hour)
+        time_slots = {}
+        for time_col in time_columns:
+            start_time, finish_time = time_col.split(" TO ")
+            print(f"Start Time: {start_time}, Finish Time: {finish_time}")
+            try:
+                lab_finish_time = (datetime.strptime(finish_time, '%I:%M') + timedelta(hours=1)).strftime('%H:%M')
+            except ValueError:
+                lab_finish_time = finish_time
+            time_slots[time_col] = (start_time, finish_time, lab_finish_time)
+
+        grid = df[[day_column, *time_columns]]
+        day_rows = grid[day_column].map(lambda day: isinstance(day, str) and bool(day.strip()))
+        for day in grid.loc[~day_rows, day_column]:
+            # --- DEBUGGING: Show which day is being skipped and why ---
+            print(f"Skipping row with day: {day}")
+
+        # Flatten the grid to one (day, time slot, cell) row per non-empty cell in a single
+        # pandas pass; the stable sort on the original index keeps the row-by-row order
+        cells = (
+            grid[day_rows]
+            .melt(id_vars=day_column, var_name="time_slot", value_name="details", ignore_index=False)
+            .dropna(subset=["details"])
+            .sort_index(kind="stable")
+        )
+        for day, time_col, cell_content in cells.itertuples(index=False, name=None):
+            start_time, finish_time, lab_finish_time = time_slots[time_col]
+            # Find all matches of either pattern in the cell content
+            print(cell_content)
+            matches = TIMETABLE_CELL_RE.findall(str(cell_content))
+            print(matches)
+            for match in matches:
+                # Unpack the tuple from findall. It will have empty strings for unmatched groups
+                lab_batch, lab_subject, lab_faculty, lab_location, lecture_subject, lecture_faculty = match
+
+                if lab_subject:
+                    # It's a lab session
+                    print(f"Detected a lab session: Batch={lab_batch}, Subject={lab_subject}, Faculty={lab_faculty}, Location={lab_location}")
+                    item_content = f"Batch: {lab_batch}, Subject: {lab_subject}, Faculty: {lab_faculty}, Lab Location: {lab_location}"
+                    new_finish_time = lab_finish_time
+                elif lecture_subject:
+                    # It's a lecture session
+                    print(f"Detected a lecture session: Subject={lecture_subject}, Faculty={lecture_faculty}")
+                    item_content = f"Subject: {lecture_subject}, Faculty: {lecture_faculty}, Room No:{lecture_room_no}"
+                    new_finish_time = finish_time
+                else:
+                    # Handle other content or skip
+                    # The code you provided shows 'Other content: 26'
+                    # You may need a different pattern or a check here
+                    print(f"Other content found and skipped.")
+                    continue
+
+                content = (f"For {day}, "
+                           f"during the {start_time} TO {new_finish_time} slot, the schedule is: {item_content}.")
+                print(content)
+                documents.append(Document(page_content=content, metadata={"source": os.path.basename(file_path), "record_type": "timetable_entry"}))
                         
         print(f"Successfully created {len(documents)} timetable documents for Division {division}.")
         return documents
@@ -170,20 +261,78 @@ def parse_timetable_from_excel(file_path: str, division: str) -> List[Document]:
         return []
 
 
+def merge_small_chunks(chunks: List[Document], count_tokens) -> List[Document]:
+    """
+    Merges each chunk shorter than SYLLABUS_MIN_CHUNK_TOKENS into the previous chunk
+    from the same page, as long as the merged chunk stays within SYLLABUS_MAX_MERGED_TOKENS.
+    """
+    merged, merged_tokens = [], []
+    for chunk in chunks:
+        tokens = count_tokens(chunk.page_content)
+        if (merged and merged[-1].metadata == chunk.metadata
+                and min(tokens, merged_tokens[-1]) < SYLLABUS_MIN_CHUNK_TOKENS
+                and merged_tokens[-1] + tokens <= SYLLABUS_MAX_MERGED_TOKENS):
+            merged[-1] = Document(page_content=f"{merged[-1].page_content}\n{chunk.page_content}", metadata=chunk.metadata)
+            merged_tokens[-1] += tokens
+        else:
+            merged.append(chunk)
+            merged_tokens.append(tokens)
+    return merged
+
 def chunk_syllabus_pdf(file_path: str) -> List[Document]:
     """Loads and chunks the unstructured syllabus PDF."""
     print(f"Chunking unstructured syllabus from: {file_path}")
     try:
-        loader = PyMuPDFLoader(file_path)
-        documents = loader.load()
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=100)
-        splits = text_splitter.split_documents(documents)
+        # Extract page text directly with PyMuPDF; the document loader also builds
+        # a dozen metadata fields per page that nothing here uses
+        with fitz.open(file_path) as doc:
+            documents = [
+                Document(page_content=page.get_text(), metadata={"source": file_path, "page": page_number})
+                for page_number, page in enumerate(doc)
+            ]
+        # Measure chunks in the embedding model's own tokens rather than characters
+        tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL)
+        text_splitter = RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
+            tokenizer, chunk_size=SYLLABUS_CHUNK_TOKENS, chunk_overlap=SYLLABUS_CHUNK_OVERLAP_TOKENS
+        )
+        splits = merge_small_chunks(
+            text_splitter.split_documents(documents),
+            lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+        )
         print(f"Successfully split syllabus into {len(splits)} chunks.")
         return splits
     except Exception as e:
         print(f"Error chunking {file_path}: {e}")
         return []
 
+def text_digest(text: str) -> str:
+    """Returns the SHA-256 hex digest used as a document's embedding cache key."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def load_embedding_cache(model_id: str) -> Dict[str, np.ndarray]:
+    """
+    Loads the cached vectors keyed by text digest. The cache is ignored if it was
+    written by a different embedding model.
+    """
+    if not os.path.exists(EMBEDDING_CACHE_PATH):
+        return {}
+    try:
+        with np.load(EMBEDDING_CACHE_PATH) as data:
+            if str(data["model_id"]) != model_id:
+                print("Embedding cache was built with a different model. Ignoring it.")
+                return {}
+            return dict(zip(data["digests"].tolist(), data["vectors"]))
+    except Exception as e:
+        print(f"Error loading embedding cache, re-embedding everything: {e}")
+        return {}
+
+def save_embedding_cache(model_id: str, digests: List[str], vectors: np.ndarray) -> None:
+    """Saves the vectors of the current documents, replacing the previous cache."""
+    # Written under a temporary name first so an interrupted save never leaves a corrupt cache
+    partial_path = EMBEDDING_CACHE_PATH + ".partial.npz"
+    np.savez_compressed(partial_path, model_id=np.array(model_id), digests=np.array(digests), vectors=vectors)
+    os.replace(partial_path, EMBEDDING_CACHE_PATH)
+
 def create_master_vector_db():
     """
     Orchestrates the entire data ingestion process:
@@ -194,29 +343,37 @@ def create_master_vector_db():
     """
     all_docs = []
     
+    # The source files are independent, so parse them concurrently. Excel parsing
+    # and text splitting are pure-Python work, so each runs in its own process to
+    # get past the GIL. Results are collected in the original order, so the
+    # documents are embedded in the same order as before.
+    with ProcessPoolExecutor(max_workers=5) as executor:
+        students_future = executor.submit(load_student_data, os.path.join(DATA_PATH, "7_Roll Numbers.pdf"))
+        allocations_future = executor.submit(load_batch_allocations, os.path.join(DATA_PATH, "7_IT_2025_BATCH ALLOCATION.pdf"))
+        timetable_e_future = executor.submit(parse_timetable_from_excel, os.path.join(DATA_PATH, "7_E.xlsx"), division="E")
+        timetable_f_future = executor.submit(parse_timetable_from_excel, os.path.join(DATA_PATH, "7_F.xlsx"), division="F")
+        syllabus_future = executor.submit(chunk_syllabus_pdf, os.path.join(DATA_PATH, "BTech IT 2025-2029 Syllabus File.pdf"))
+
     # --- 1. Enriched Student Profiles ---
-    students = load_student_data(os.path.join(DATA_PATH, "7_Roll Numbers.pdf"))
-    allocations = load_batch_allocations(os.path.join(DATA_PATH, "7_IT_2025_BATCH ALLOCATION.pdf"))
+    students = students_future.result()
+    allocations, allocation_from_ids = index_batch_allocations(allocations_future.result())
 
     print("\nCreating enriched documents for each student...")
-    for student in students:
-        exam_no = student["exam_no"]
-        batch, counselor = get_batch_for_student(exam_no, allocations)
-        content = (f"Student Profile. Full Name: {student['name']}. "
-                   f"Exam Number: {exam_no}. "
-                   f"Student ID: {student.get('student_id', 'Not Available')}.")
-        if batch and counselor:
-            content += f" Batch: {batch}. Faculty Counselor: {counselor}."
-        doc = Document(page_content=content, metadata={"source": "Multiple Files", "record_type": "student_profile"})
-        all_docs.append(doc)
+    all_docs.extend(
+        Document(
+            page_content=format_student_profile(student, *get_batch_for_student(student["exam_no_num"], allocations, allocation_from_ids)),
+            metadata=STUDENT_PROFILE_METADATA
+        )
+        for student in students
+    )
     print(f"Successfully created {len(students)} enriched student profiles.")
 
     # --- 2. Timetable Parsing (using the new Excel files) ---
-    all_docs.extend(parse_timetable_from_excel(os.path.join(DATA_PATH, "7_E.xlsx"), division="E"))
-    all_docs.extend(parse_timetable_from_excel(os.path.join(DATA_PATH, "7_F.xlsx"), division="F"))
+    all_docs.extend(timetable_e_future.result())
+    all_docs.extend(timetable_f_future.result())
     
     # --- 3. Syllabus Chunking ---
-    all_docs.extend(chunk_syllabus_pdf(os.path.join(DATA_PATH, "BTech IT 2025-2029 Syllabus File.pdf")))
+    all_docs.extend(syllabus_future.result())
     
     # --- 4. Vector Store Creation ---
     print(f"\nTotal documents and chunks to be embedded: {len(all_docs)}")
@@ -225,14 +382,62 @@ def create_master_vector_db():
         return
         
     print("Loading embedding model...")
-    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL, model_kwargs={'device': 'cpu'})
+    # The same loader as the RAG service, so documents and queries are embedded identically
+    # (GPU when available, else the INT8 ONNX model if built, batched and normalized)
+    embeddings = load_embeddings()
     
     if not os.path.exists(DB_FAISS_PATH):
         os.makedirs(DB_FAISS_PATH)
         
+    texts = [doc.page_content for doc in all_docs]
+    metadatas = [doc.metadata for doc in all_docs]
+    # The ONNX and PyTorch builds give slightly different vectors, so both are part of the identity
+    model_id = f"{EMBEDDING_MODEL}|{type(embeddings).__name__}"
+    digests = [text_digest(text) for text in texts]
+    cache = load_embedding_cache(model_id)
+    # Documents with identical text are embedded once: map each missing digest to
+    # every position that needs its vector
+    misses = {}
+    for i, digest in enumerate(digests):
+        if digest not in cache:
+            misses.setdefault(digest, []).append(i)
+    print(f"Embedding cache: {len(texts) - sum(map(len, misses.values()))} hits, {len(misses)} unique misses.")
+
+    dim = len(next(iter(cache.values()))) if cache else len(embeddings.embed_query("dimension probe"))
+    vectors = np.empty((len(texts), dim), dtype=np.float32)
+    for i, digest in enumerate(digests):
+        if digest in cache:
+            vectors[i] = cache[digest]
+    del cache
+    if misses:
+        print("Embedding new and changed documents...")
+        # Only one chunk of embeddings is held in Python lists at a time
+        missing_rows = list(misses.values())
+        for start in range(0, len(missing_rows), INGEST_CHUNK_SIZE):
+            chunk = missing_rows[start:start + INGEST_CHUNK_SIZE]
+            for rows, vector in zip(chunk, embeddings.embed_documents([texts[rows[0]] for rows in chunk])):
+                vectors[rows] = vector
+        save_embedding_cache(model_id, digests, vectors)
+
     print("Creating and saving master FAISS vector store...")
-    db = FAISS.from_documents(all_docs, embeddings)
-    db.save_local(DB_FAISS_PATH)
+    # An HNSW graph index gives sublinear search instead of scanning every vector,
+    # and scalar-quantized storage shrinks the memory of the stored vectors
+    index = faiss.IndexHNSWSQ(vectors.shape[1], VECTOR_QUANTIZER, HNSW_M)
+    index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    if not index.is_trained:
+        index.train(vectors)
+    for start in range(0, len(texts), INGEST_CHUNK_SIZE):
+        index.add(vectors[start:start + INGEST_CHUNK_SIZE])
+    # The index holds its own quantized copy, so the FP32 vectors can go before saving
+    del vectors
+    # The raw index is written with FAISS's own format; the documents go to a JSONL
+    # file (line i is the document at index position i) instead of a pickled docstore
+    faiss.write_index(index, INDEX_PATH)
+    with open(DOCSTORE_PATH, "w", encoding="utf-8") as f:
+        f.writelines(
+            json.dumps({"id": i, "content": text, "metadata": metadata}, ensure_ascii=False) + "\n"
+            for i, (text, metadata) in enumerate(zip(texts, metadatas))
+        )
     print(f"\nMaster vector store created successfully at '{DB_FAISS_PATH}'.")
 
 
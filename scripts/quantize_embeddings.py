@@ -0,0 +1,37 @@
+"""
+One-shot script to convert the BGE embedding model to a dynamically quantized INT8 ONNX model.
+
+The model is exported to ONNX with Optimum and its weights are quantized with
+onnxruntime's dynamic quantization (VNNI kernels). The RAG service picks up the
+result automatically if it exists and embeddings run on the CPU.
+"""
+import os
+import sys
+from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig
+from transformers import AutoTokenizer
+
+# Add the project root to the Python path to allow for absolute imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.rag_service import EMBEDDING_MODEL, EMBEDDING_ONNX_PATH
+
+ONNX_EXPORT_PATH = "models/bge-onnx"
+
+def quantize_embedding_model():
+    """Exports the embedding model to ONNX, then applies dynamic INT8 weight quantization."""
+    print(f"Exporting '{EMBEDDING_MODEL}' to ONNX...")
+    model = ORTModelForFeatureExtraction.from_pretrained(EMBEDDING_MODEL, export=True)
+    tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL)
+    model.save_pretrained(ONNX_EXPORT_PATH)
+    print(f"Exported ONNX model to '{ONNX_EXPORT_PATH}'.")
+
+    quantizer = ORTQuantizer.from_pretrained(model)
+    quantization_config = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+    quantizer.quantize(save_dir=EMBEDDING_ONNX_PATH, quantization_config=quantization_config)
+    tokenizer.save_pretrained(EMBEDDING_ONNX_PATH)
+    print(f"INT8 embedding model saved to '{EMBEDDING_ONNX_PATH}'.")
+
+if __name__ == '__main__':
+    # To run this script, execute `python -m scripts.quantize_embeddings` from the project root.
+    quantize_embedding_model()
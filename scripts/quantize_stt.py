@@ -0,0 +1,69 @@
+"""
+One-shot script to convert the Gujarati Wav2Vec2 STT model to an INT8 OpenVINO model.
+
+The PyTorch model is exported to ONNX, converted to OpenVINO IR and then quantized
+with NNCF post-training quantization, using a small set of Gujarati recordings as
+calibration data. SpeechToSpeech.py picks up the result automatically if it exists.
+"""
+import os
+import sys
+import torch
+import openvino as ov
+import nncf
+from transformers import Wav2Vec2ForCTC, Wav2Vec2Processor
+
+# Add the project root to the Python path to allow for absolute imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scripts.stt_calibration import STT_MODEL_NAME, TARGET_SAMPLE_RATE, load_calibration_inputs
+
+ONNX_PATH = "models/stt.onnx"
+OV_INT8_PATH = "models/stt_int8.xml"
+
+def export_to_onnx(model) -> None:
+    """Exports the PyTorch model to ONNX with a dynamic batch and audio length."""
+    dummy_input_values = torch.zeros(1, TARGET_SAMPLE_RATE, dtype=torch.float32)
+    torch.onnx.export(
+        model,
+        dummy_input_values,
+        ONNX_PATH,
+        input_names=["input_values"],
+        output_names=["logits"],
+        opset_version=14,
+        dynamic_axes={
+            "input_values": {0: "batch", 1: "samples"},
+            "logits": {0: "batch", 1: "frames"},
+        },
+    )
+    print(f"Exported ONNX model to '{ONNX_PATH}'.")
+
+def quantize_stt_model():
+    """Exports, converts and INT8-quantizes the STT model, then saves the OpenVINO IR."""
+    processor = Wav2Vec2Processor.from_pretrained(STT_MODEL_NAME)
+    model = Wav2Vec2ForCTC.from_pretrained(STT_MODEL_NAME).eval()
+
+    calibration_inputs = load_calibration_inputs(processor)
+    if not calibration_inputs:
+        print("No calibration data available. Aborting quantization.")
+        return
+
+    os.makedirs(os.path.dirname(ONNX_PATH), exist_ok=True)
+    export_to_onnx(model)
+
+    ov_model = ov.convert_model(ONNX_PATH)
+    calibration_dataset = nncf.Dataset(calibration_inputs, lambda input_values: {"input_values": input_values})
+
+    print("Running NNCF post-training quantization...")
+    quantized_model = nncf.quantize(
+        ov_model,
+        calibration_dataset,
+        preset=nncf.QuantizationPreset.MIXED,
+        model_type=nncf.ModelType.TRANSFORMER,
+        subset_size=len(calibration_inputs),
+    )
+    ov.save_model(quantized_model, OV_INT8_PATH)
+    print(f"INT8 STT model saved to '{OV_INT8_PATH}'.")
+
+if __name__ == '__main__':
+    # To run this script, execute `python -m scripts.quantize_stt` from the project root.
+    quantize_stt_model()
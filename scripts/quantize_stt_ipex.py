@@ -0,0 +1,53 @@
+"""
+One-shot script to build a static INT8 TorchScript version of the Gujarati STT model
+with Intel Extension for PyTorch (IPEX).
+
+Observers are calibrated on Gujarati recordings, the model is converted to oneDNN
+INT8 kernels, then traced and frozen so it can be loaded without IPEX's Python-side
+preparation. SpeechToSpeech.py picks up the result automatically if it exists.
+"""
+import os
+import sys
+import torch
+import intel_extension_for_pytorch as ipex
+from intel_extension_for_pytorch.quantization import prepare, convert
+from transformers import Wav2Vec2ForCTC, Wav2Vec2Processor
+
+# Add the project root to the Python path to allow for absolute imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scripts.stt_calibration import STT_MODEL_NAME, load_calibration_inputs
+
+IPEX_INT8_PATH = "models/stt_ipex_int8.pt"
+
+def quantize_stt_model_ipex():
+    """Calibrates, converts, traces and saves the INT8 IPEX STT model."""
+    processor = Wav2Vec2Processor.from_pretrained(STT_MODEL_NAME)
+    # torchscript=True makes the model return plain tuples, which tracing requires
+    model = Wav2Vec2ForCTC.from_pretrained(STT_MODEL_NAME, torchscript=True).eval()
+
+    calibration_inputs = load_calibration_inputs(processor, return_tensors="pt")
+    if not calibration_inputs:
+        print("No calibration data available. Aborting quantization.")
+        return
+
+    example_input = calibration_inputs[0]
+    qconfig = ipex.quantization.default_static_qconfig_mapping
+    prepared = prepare(model, qconfig, example_inputs=example_input, inplace=False)
+
+    print("Calibrating INT8 observers...")
+    with torch.no_grad():
+        for input_values in calibration_inputs:
+            prepared(input_values)
+
+    quantized_model = convert(prepared)
+    with torch.no_grad():
+        traced_model = torch.jit.freeze(torch.jit.trace(quantized_model, example_input))
+
+    os.makedirs(os.path.dirname(IPEX_INT8_PATH), exist_ok=True)
+    traced_model.save(IPEX_INT8_PATH)
+    print(f"INT8 IPEX STT model saved to '{IPEX_INT8_PATH}'.")
+
+if __name__ == '__main__':
+    # To run this script, execute `python -m scripts.quantize_stt_ipex` from the project root.
+    quantize_stt_model_ipex()
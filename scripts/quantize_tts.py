@@ -0,0 +1,56 @@
+"""
+One-shot script to convert the Gujarati VITS TTS model to a dynamically quantized ONNX model.
+
+The PyTorch model is exported to ONNX and its weights are quantized to INT8 with
+onnxruntime's dynamic quantization. SpeechToSpeech.py picks up the result
+automatically if it exists.
+"""
+import os
+import torch
+from onnxruntime.quantization import quantize_dynamic, QuantType
+from transformers import VitsModel, AutoTokenizer
+
+TTS_MODEL_NAME = "facebook/mms-tts-guj"
+ONNX_PATH = "models/tts.onnx"
+ONNX_INT8_PATH = "models/tts_int8.onnx"
+
+class WaveformOnly(torch.nn.Module):
+    """Wraps VitsModel so the exported graph has a single `waveform` output."""
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask).waveform
+
+def quantize_tts_model():
+    """Exports the TTS model to ONNX, then applies dynamic INT8 weight quantization."""
+    tokenizer = AutoTokenizer.from_pretrained(TTS_MODEL_NAME)
+    model = VitsModel.from_pretrained(TTS_MODEL_NAME).eval()
+
+    os.makedirs(os.path.dirname(ONNX_PATH), exist_ok=True)
+    sample = tokenizer("નમસ્તે, તમે કેમ છો?", return_tensors="pt")
+
+    print("Exporting TTS model to ONNX...")
+    with torch.no_grad():
+        torch.onnx.export(
+            WaveformOnly(model),
+            (sample["input_ids"], sample["attention_mask"]),
+            ONNX_PATH,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["waveform"],
+            opset_version=14,
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "tokens"},
+                "attention_mask": {0: "batch", 1: "tokens"},
+                "waveform": {0: "batch", 1: "samples"},
+            },
+        )
+    print(f"Exported ONNX model to '{ONNX_PATH}'.")
+
+    quantize_dynamic(ONNX_PATH, ONNX_INT8_PATH, weight_type=QuantType.QInt8)
+    print(f"INT8 TTS model saved to '{ONNX_INT8_PATH}'.")
+
+if __name__ == '__main__':
+    # To run this script, execute `python -m scripts.quantize_tts` from the project root.
+    quantize_tts_model()
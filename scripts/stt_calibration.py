@@ -0,0 +1,37 @@
+"""
+Shared helpers for the STT quantization scripts: model name, sample rate and a
+loader for the Gujarati calibration recordings.
+"""
+import os
+import soundfile as sf
+
+STT_MODEL_NAME = "addy88/wav2vec2-gujarati-stt"
+CALIBRATION_PATH = "data/stt_calibration/"
+TARGET_SAMPLE_RATE = 16000
+MAX_CALIBRATION_CLIPS = 100
+
+def load_calibration_inputs(processor, directory: str = CALIBRATION_PATH, return_tensors: str = "np"):
+    """
+    Loads up to MAX_CALIBRATION_CLIPS mono 16 kHz recordings from the calibration
+    folder and turns them into model-ready input_values arrays.
+    """
+    if not os.path.exists(directory):
+        print(f"Error: Calibration folder not found at '{directory}'")
+        return []
+
+    inputs = []
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(('.wav', '.flac')):
+            continue
+        audio, sample_rate = sf.read(os.path.join(directory, name), dtype='float32')
+        if audio.ndim > 1:
+            audio = audio.mean(axis=1)
+        if sample_rate != TARGET_SAMPLE_RATE:
+            print(f"Skipping '{name}': expected {TARGET_SAMPLE_RATE} Hz, got {sample_rate} Hz.")
+            continue
+        inputs.append(processor(audio, sampling_rate=TARGET_SAMPLE_RATE, return_tensors=return_tensors).input_values)
+        if len(inputs) >= MAX_CALIBRATION_CLIPS:
+            break
+
+    print(f"Loaded {len(inputs)} calibration clips from '{directory}'.")
+    return inputs